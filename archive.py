@@ -0,0 +1,152 @@
+"""
+Monthly archives of old raw logs.
+
+Raw meditation, exercise and weight entries older than the compaction horizon are
+folded into one document per month (id "YYYY-MM") in ARCHIVE_COLLECTION, holding
+per-day arrays aligned with `days`:
+
+    schema_version      SCHEMA_VERSION
+    month               "YYYY-MM"
+    days                [1, 2, 5, ...]            day of month, ascending
+    meditation_minutes  [20, 0, 15, ...]
+    weight              [78.2, None, 77.9, ...]   last weight of the day
+    exercise            {activity: {"minutes": [...], "calories": [...]}}
+    through_ms          entries with ts_ms below this were folded...
+    compacted_at_ms     ...if they were written by this time
+
+Readers expand archives back into canonical daily-total rows, so charts and KPIs
+treat them like any other log entry.
+"""
+import datetime
+
+import pandas as pd
+
+from schema import SCHEMA_VERSION
+
+ARCHIVE_COLLECTION = "daily_logs_archive"
+
+
+def month_of(row):
+    return row["date_str"][:7]
+
+
+def empty_archive(month):
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "month": month,
+        "days": [],
+        "meditation_minutes": [],
+        "weight": [],
+        "exercise": {},
+        "through_ms": 0,
+        "compacted_at_ms": 0,
+    }
+
+
+def _day_index(archive, day):
+    """Index of `day` in the archive arrays, inserting a zeroed slot if needed."""
+    days = archive["days"]
+    if day in days:
+        return days.index(day)
+    idx = sum(1 for d in days if d < day)
+    days.insert(idx, day)
+    archive["meditation_minutes"].insert(idx, 0)
+    archive["weight"].insert(idx, None)
+    for series in archive["exercise"].values():
+        series["minutes"].insert(idx, 0)
+        series["calories"].insert(idx, 0)
+    return idx
+
+
+def fold(archive, rows, through_ms, compacted_at_ms):
+    """
+    Adds canonical rows (all from the archive's month, ascending ts_ms) to its daily totals.
+    Returns the updated archive.
+    """
+    for row in rows:
+        idx = _day_index(archive, int(row["date_str"][8:10]))
+        if row["type"] == "meditation":
+            archive["meditation_minutes"][idx] += row.get("duration_minutes") or 0
+        elif row["type"] == "exercise":
+            activity = row.get("activity") or "Vario"
+            if activity not in archive["exercise"]:
+                size = len(archive["days"])
+                archive["exercise"][activity] = {"minutes": [0] * size, "calories": [0] * size}
+            series = archive["exercise"][activity]
+            series["minutes"][idx] += row.get("duration_minutes") or 0
+            series["calories"][idx] += row.get("calories") or 0
+        elif row["type"] == "weight":
+            # Rows arrive oldest first, so the last one wins
+            archive["weight"][idx] = row.get("weight")
+
+    archive["through_ms"] = max(archive["through_ms"], through_ms)
+    archive["compacted_at_ms"] = max(archive["compacted_at_ms"], compacted_at_ms)
+    return archive
+
+
+def _day_row(month, day, log_type, **fields):
+    date = datetime.date(int(month[:4]), int(month[5:7]), day)
+    noon = datetime.datetime(date.year, date.month, date.day, 12, tzinfo=datetime.timezone.utc)
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "type": log_type,
+        # Daily totals sit at local noon; the offset is folded into ts_ms
+        "ts_ms": int(noon.timestamp() * 1000),
+        "tz_offset_min": 0,
+        "date_str": date.isoformat(),
+        "archived": True,
+        **fields,
+    }
+
+
+def expand(archive, start_ms=None):
+    """Canonical daily-total rows for one archive, optionally from start_ms on."""
+    month = archive["month"]
+    rows = []
+    for idx, day in enumerate(archive["days"]):
+        day_rows = []
+        if archive["meditation_minutes"][idx]:
+            day_rows.append(_day_row(month, day, "meditation", duration_minutes=archive["meditation_minutes"][idx]))
+        for activity, series in archive["exercise"].items():
+            if series["minutes"][idx] or series["calories"][idx]:
+                day_rows.append(_day_row(
+                    month, day, "exercise", activity=activity,
+                    duration_minutes=series["minutes"][idx], calories=series["calories"][idx]
+                ))
+        if archive["weight"][idx] is not None:
+            day_rows.append(_day_row(month, day, "weight", weight=archive["weight"][idx]))
+        rows.extend(r for r in day_rows if start_ms is None or r["ts_ms"] >= start_ms)
+    return rows
+
+
+def expand_all(archives, start_ms=None):
+    return [row for archive in archives for row in expand(archive, start_ms)]
+
+
+def latest_live(history):
+    """
+    Latest version of each raw row (DataFrame with id, in write order), without
+    deleted entries: a snapshot tombstone (deleted=True) shadows its entry's id.
+    """
+    if not history.empty:
+        history = history.drop_duplicates("id", keep="last")
+    if "deleted" in history:
+        history = history[history["deleted"] != True].drop(columns="deleted")
+    return history
+
+
+def drop_folded(history, archives):
+    """
+    Drops raw rows (DataFrame with written_ms) already counted in a monthly archive,
+    e.g. a host-local snapshot still holding documents the compaction deleted.
+    `archives` maps month to archive.
+    """
+    if history.empty or not archives:
+        return history
+    bounds = pd.DataFrame([
+        {"month": month, "through_ms": a["through_ms"], "compacted_at_ms": a["compacted_at_ms"]}
+        for month, a in archives.items()
+    ])
+    merged = history.assign(month=history["date_str"].str[:7]).merge(bounds, on="month", how="left")
+    folded = (merged["ts_ms"] < merged["through_ms"]) & (merged["written_ms"].fillna(0) <= merged["compacted_at_ms"])
+    return history[~folded.to_numpy()]
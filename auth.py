@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+import streamlit as st
+
+# --- Authentication Constants ---
+MASTER_PASSWORD = "papera70"
+
+SESSION_COOKIE = "anchor_session"
+SESSION_TTL_SECONDS = 30 * 24 * 3600
+
+
+def _session_secret():
+    """
+    Signing key for session tokens: ANCHOR_SESSION_SECRET, then st.secrets["auth_secret"].
+    Falls back to a key derived from the access code, so changing it revokes all sessions.
+    """
+    secret = os.environ.get("ANCHOR_SESSION_SECRET")
+    if not secret:
+        try:
+            secret = st.secrets.get("auth_secret")
+        except Exception:
+            secret = None
+    if not secret:
+        secret = "anchor-session:" + MASTER_PASSWORD
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def _sign(payload):
+    digest = hmac.new(_session_secret(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def issue_token(ttl=SESSION_TTL_SECONDS):
+    """Returns a signed '<expires>.<nonce>.<signature>' token."""
+    payload = f"{int(time.time()) + ttl}.{secrets.token_urlsafe(12)}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token):
+    """True for an untampered, unexpired token."""
+    if not token:
+        return False
+    try:
+        expires, nonce, signature = token.split(".")
+        if int(expires) < time.time():
+            return False
+    except ValueError:
+        return False
+    # As bytes: compare_digest raises on non-ASCII str, and cookies are client input
+    return hmac.compare_digest(signature.encode(), _sign(f"{expires}.{nonce}").encode())
+
+
+def session_from_cookie():
+    """Validates the session cookie sent with the websocket handshake."""
+    return verify_token(st.context.cookies.get(SESSION_COOKIE))
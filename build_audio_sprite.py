@@ -0,0 +1,85 @@
+"""
+Packs the meditation voice clips (and the gong, if present) into one audio sprite.
+
+    python build_audio_sprite.py [--gap 0.5] [--bitrate 96k]
+
+Writes assets/audio/sprite.m4a and assets/audio/sprite.json, the manifest of
+start/end offsets (seconds) the meditation player seeks to. Clips are decoded to
+PCM, so offsets are sample-exact, joined with short silences so a late seek never
+bleeds into the next clip, then encoded once. Needs ffmpeg on PATH.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+
+AUDIO_DIR = "assets/audio"
+SPRITE_FILE = os.path.join(AUDIO_DIR, "sprite.m4a")
+MANIFEST_FILE = os.path.join(AUDIO_DIR, "sprite.json")
+GONG_FILE = os.path.join(AUDIO_DIR, "Gong Semplice.mp3")
+
+SAMPLE_RATE = 44100
+BYTES_PER_SAMPLE = 2  # s16le mono
+
+
+def decode(path):
+    """Raw mono 16-bit PCM at SAMPLE_RATE."""
+    return subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", path, "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"],
+        check=True, capture_output=True,
+    ).stdout
+
+
+def clip_sources():
+    """(name, path) in sprite order: voice clips by filename, then the gong."""
+    sources = [
+        (os.path.splitext(os.path.basename(path))[0], path)
+        for path in sorted(glob.glob(os.path.join(AUDIO_DIR, "*.m4a")))
+        if os.path.abspath(path) != os.path.abspath(SPRITE_FILE)
+    ]
+    if os.path.exists(GONG_FILE):
+        sources.append(("gong", GONG_FILE))
+    return sources
+
+
+def build(gap=0.5, bitrate="96k"):
+    silence = b"\0" * (int(gap * SAMPLE_RATE) * BYTES_PER_SAMPLE)
+    pcm = bytearray()
+    clips = {}
+    for name, path in clip_sources():
+        data = decode(path)
+        start = len(pcm) / BYTES_PER_SAMPLE / SAMPLE_RATE
+        pcm += data
+        clips[name] = {"start": round(start, 4), "end": round(len(pcm) / BYTES_PER_SAMPLE / SAMPLE_RATE, 4)}
+        pcm += silence
+
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "-",
+         "-c:a", "aac", "-b:a", bitrate, "-movflags", "+faststart", SPRITE_FILE],
+        input=bytes(pcm), check=True,
+    )
+    with open(SPRITE_FILE, "rb") as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:12]
+
+    manifest = {"file": os.path.basename(SPRITE_FILE), "mime": "audio/mp4", "version": version, "clips": clips}
+    with open(MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the meditation audio sprite and its manifest.")
+    parser.add_argument("--gap", type=float, default=0.5, help="Silence between clips (s)")
+    parser.add_argument("--bitrate", default="96k")
+    args = parser.parse_args()
+
+    manifest = build(args.gap, args.bitrate)
+    for name, clip in manifest["clips"].items():
+        print(f"{name:<16} {clip['start']:>8.3f} - {clip['end']:>8.3f} s")
+    print(f"Wrote {SPRITE_FILE} and {MANIFEST_FILE} (version {manifest['version']})")
+
+
+if __name__ == "__main__":
+    main()
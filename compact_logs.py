@@ -0,0 +1,89 @@
+"""
+Folds raw logs older than a horizon into monthly archive documents (see archive.py).
+
+    python compact_logs.py [--horizon-days 180] [--dry-run]
+
+Each batched write updates one month's archive and deletes the raw documents it
+absorbed, so an interrupted run never counts an entry twice; re-running picks up
+where it stopped.
+"""
+import argparse
+import datetime
+import time
+from itertools import groupby
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from archive import ARCHIVE_COLLECTION, empty_archive, fold, month_of
+from schema import to_canonical, to_epoch_ms
+from utils import db, COLLECTION_NAME
+
+# Firestore caps a batched write at 500 operations: one archive write + the deletes
+MAX_DELETES_PER_BATCH = 499
+DEFAULT_HORIZON_DAYS = 180
+
+
+def cutoff_ms(horizon_days):
+    """Local midnight `horizon_days` ago, so days are archived whole."""
+    day = datetime.date.today() - datetime.timedelta(days=horizon_days)
+    return to_epoch_ms(datetime.datetime.combine(day, datetime.time()))
+
+
+def compact(horizon_days=DEFAULT_HORIZON_DAYS, dry_run=False, page_size=MAX_DELETES_PER_BATCH):
+    through_ms = cutoff_ms(horizon_days)
+    archives = db.collection(ARCHIVE_COLLECTION)
+    query = (
+        db.collection(COLLECTION_NAME)
+        .where(filter=FieldFilter('ts_ms', '<', through_ms))
+        .order_by('ts_ms')
+        .limit(page_size)
+    )
+    folded = 0
+    last_doc = None
+
+    while True:
+        # Live runs delete what they fold, so the first page is always the next one
+        page = db.get(query.start_after(last_doc) if dry_run and last_doc else query, timeout=30)
+        if not page:
+            break
+        last_doc = page[-1]
+
+        docs = [(doc, to_canonical(doc.to_dict())) for doc in page]
+        docs.sort(key=lambda item: (month_of(item[1]), item[1]['ts_ms']))
+        for month, group in groupby(docs, key=lambda item: month_of(item[1])):
+            group = list(group)
+            ref = archives.document(month)
+            snapshot = db.get_document(ref)
+            archive = snapshot.to_dict() if snapshot.exists else empty_archive(month)
+            # Stamped before the commit: every folded document was written earlier
+            archive = fold(archive, [row for _, row in group], through_ms, int(time.time() * 1000))
+
+            if not dry_run:
+                batch = db.batch()
+                batch.set(ref, archive)
+                for doc, _ in group:
+                    batch.delete(doc.reference)
+                batch.commit()
+            folded += len(group)
+            print(f"{month}: folded {len(group)} entries")
+
+    return folded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old daily_logs entries into monthly archives.")
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS,
+                        help="Keep raw entries newer than this many days")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be folded without writing")
+    args = parser.parse_args()
+
+    if db is None:
+        raise SystemExit("Firestore is not configured.")
+
+    folded = compact(args.horizon_days, args.dry_run)
+    verb = "Would fold" if args.dry_run else "Folded"
+    print(f"Done. {verb} {folded} entries older than {args.horizon_days} days.")
+
+
+if __name__ == "__main__":
+    main()
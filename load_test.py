@@ -0,0 +1,241 @@
+"""
+Load harness for timer-heavy workloads.
+
+Simulates N concurrent browser sessions at the Streamlit websocket protocol
+level. Each session resumes a signed session cookie, then starts either an
+exercise timer ("START SESSION") or a meditation run ("START MISSION"),
+both of which rerun the script every second on the server.
+
+    python load_test.py --sessions 20 --flow mixed --duration 60 --server-pid 1234
+
+Reports, per session, over the measurement window:
+- rerun rate (script runs per second)
+- websocket bytes received per second
+- rerun latency p50/p99: run start to the last delta of that run, so the
+  one-second sleep before st.rerun() in the timer loops is not counted
+- server CPU (needs --server-pid and psutil, same host)
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlparse
+
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from auth import SESSION_COOKIE, issue_token
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+NAVIGATION = {"Dashboard": 0, "Meditation": 1, "Exercise": 2}
+EXERCISE_ACTIVITY = "E-bike"
+
+
+class SimulatedSession:
+    """One browser tab: a websocket, its widget state and per-run timings."""
+
+    def __init__(self, url, token, query_string=""):
+        self.url = url
+        self.token = token
+        self.query_string = query_string
+        self.page_script_hash = ""
+        self.conn = None
+        self.reader = None
+
+        self.widget_ids = {}  # label -> widget id, from the latest deltas
+        self.widget_states = {}  # widget id -> (value field, value), resent every rerun
+
+        self.run_started = None
+        self.last_delta = None
+        self.reruns = 0
+        self.bytes_received = 0
+        self.latencies = []
+
+    async def connect(self):
+        # The app reads the session cookie from the websocket handshake
+        request = HTTPRequest(self.url, headers={"Cookie": f"{SESSION_COOKIE}={self.token}"})
+        self.conn = await websocket_connect(request, subprotocols=["streamlit"])
+        self.reader = asyncio.create_task(self._read_loop())
+        # Browsers request the first run as soon as the socket opens
+        await self.rerun()
+
+    async def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        if self.reader is not None:
+            self.reader.cancel()
+
+    async def _read_loop(self):
+        while True:
+            raw = await self.conn.read_message()
+            if raw is None:
+                break
+            self.bytes_received += len(raw)
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            self._handle(msg)
+
+    def _handle(self, msg):
+        now = time.perf_counter()
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.run_started = now
+            self.last_delta = None
+            self.reruns += 1
+            self.page_script_hash = msg.new_session.page_script_hash
+        elif kind == "delta":
+            self.last_delta = now
+            if msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in ("button", "radio"):
+                    widget = getattr(element, element_type)
+                    self.widget_ids[widget.label] = widget.id
+        elif kind == "script_finished":
+            if self.run_started is not None:
+                self.latencies.append((self.last_delta or now) - self.run_started)
+
+    async def rerun(self, trigger_id=None):
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        for widget_id, (field, value) in self.widget_states.items():
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            setattr(state, field, value)
+        if trigger_id is not None:
+            # Button clicks are one-shot: sent once, never persisted
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = trigger_id
+            state.trigger_value = True
+        await self.conn.write_message(msg.SerializeToString(), binary=True)
+
+    async def wait_for_widget(self, label_part, timeout=30):
+        deadline = time.perf_counter() + timeout
+        while True:
+            for label, widget_id in self.widget_ids.items():
+                if label_part in label:
+                    return widget_id
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Widget '{label_part}' never rendered")
+            await asyncio.sleep(0.05)
+
+    async def click(self, label_part):
+        await self.rerun(trigger_id=await self.wait_for_widget(label_part))
+
+    async def navigate(self, page):
+        widget_id = await self.wait_for_widget("Navigation")
+        self.widget_states[widget_id] = ("int_value", NAVIGATION[page])
+        await self.rerun()
+
+
+async def start_flow(session, flow):
+    """Drives a session from login to a running timer."""
+    await session.connect()
+    if flow == "exercise":
+        await session.navigate("Exercise")
+        await session.click(EXERCISE_ACTIVITY)
+        await session.click("START SESSION")
+    else:
+        await session.navigate("Meditation")
+        await session.click("START MISSION")
+
+
+def snapshot(sessions):
+    return [(s.reruns, s.bytes_received, len(s.latencies)) for s in sessions]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def report(sessions, before, elapsed, cpu_seconds):
+    n = len(sessions)
+    reruns = sum(s.reruns - b[0] for s, b in zip(sessions, before))
+    received = sum(s.bytes_received - b[1] for s, b in zip(sessions, before))
+    latencies = [lat for s, b in zip(sessions, before) for lat in s.latencies[b[2]:]]
+
+    print(f"Sessions:            {n}")
+    print(f"Window:              {elapsed:.1f} s")
+    print(f"Reruns/s/session:    {reruns / elapsed / n:.2f}")
+    print(f"WS bytes/s/session:  {received / elapsed / n:,.0f}")
+    print(f"Rerun latency p50:   {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"Rerun latency p99:   {percentile(latencies, 99) * 1000:.1f} ms")
+    if cpu_seconds is not None:
+        print(f"Server CPU/session:  {cpu_seconds / elapsed / n * 100:.1f} % of a core")
+
+
+def server_cpu_seconds(process):
+    times = process.cpu_times()
+    return times.user + times.system
+
+
+async def run(args):
+    parsed = urlparse(args.url)
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    ws_url = f"{scheme}://{parsed.netloc}/_stcore/stream"
+
+    process = None
+    if args.server_pid:
+        if psutil is None:
+            raise SystemExit("--server-pid needs psutil (pip install psutil)")
+        process = psutil.Process(args.server_pid)
+
+    flows = []
+    for i in range(args.sessions):
+        if args.flow == "mixed":
+            flows.append("exercise" if i % 2 == 0 else "meditation")
+        else:
+            flows.append(args.flow)
+
+    token = args.token or issue_token()
+    sessions = [SimulatedSession(ws_url, token) for _ in flows]
+    try:
+        # Ramp up so logins don't all land in the same second
+        delay = args.ramp / max(1, len(sessions))
+        starts = []
+        for session, flow in zip(sessions, flows):
+            starts.append(asyncio.create_task(start_flow(session, flow)))
+            await asyncio.sleep(delay)
+        await asyncio.gather(*starts)
+        print(f"{len(sessions)} sessions running, warming up for {args.warmup}s...")
+        await asyncio.sleep(args.warmup)
+
+        before = snapshot(sessions)
+        cpu_before = server_cpu_seconds(process) if process else None
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - started
+        cpu_seconds = server_cpu_seconds(process) - cpu_before if process else None
+
+        report(sessions, before, elapsed, cpu_seconds)
+    finally:
+        for session in sessions:
+            await session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent timer sessions against a running app.")
+    parser.add_argument("--url", default="http://localhost:8501")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--flow", choices=["exercise", "meditation", "mixed"], default="mixed")
+    parser.add_argument("--duration", type=float, default=60, help="Measurement window (s)")
+    parser.add_argument("--warmup", type=float, default=5, help="Wait after all timers start (s)")
+    parser.add_argument("--ramp", type=float, default=5, help="Spread session starts over this many seconds")
+    parser.add_argument("--token", help="Session token (default: signed locally; needs the server's signing secret)")
+    parser.add_argument("--server-pid", type=int, help="Streamlit server PID, for CPU accounting")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,13 @@ st.set_page_config(
 )
 
 import base64
-from modules import dashboard, meditation, exercise
+from modules import dashboard, meditation, exercise, history
+from auth import MASTER_PASSWORD, SESSION_COOKIE, SESSION_TTL_SECONDS, issue_token, session_from_cookie
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import metering
+import profiler
+import outbox
 
 # --- CSS Injection ---
 def get_base64_of_bin_file(bin_file):
@@ -47,62 +52,20 @@ def local_css(file_name):
 
 local_css("styles.css")
 
-# --- Persistent JS Component (Wake Lock & Auth Persistence) ---
+# --- Persistent JS Component (Wake Lock + Outbox) ---
 def inject_session_manager():
-    # This component stays active across reruns if called in both show_login and show_app
-    # It handles Screen Wake Lock and persists the 'authenticated' state in localStorage
-    js_code = f"""
-    <script>
-    // 1. Screen Wake Lock
-    let wakeLock = null;
-    const requestWakeLock = async () => {{
-        try {{
-            wakeLock = await navigator.wakeLock.request('screen');
-            console.log('Wake Lock is active');
-        }} catch (err) {{
-            console.error(`${{err.name}}, ${{err.message}}`);
-        }}
-    }};
-
-    if ('wakeLock' in navigator) {{
-        requestWakeLock();
-        // Re-request when visible again
-        document.addEventListener('visibilitychange', async () => {{
-            if (wakeLock !== null && document.visibilityState === 'visible') {{
-                requestWakeLock();
-            }}
-        }});
-    }}
-
-    // 2. Auth Persistence
-    const MASTER_PASSWORD = "papera70"; // Sync with Python
-    
-    // Check if we need to auto-login
-    const savedAuth = localStorage.getItem('anchor_authenticated');
-    const urlParams = new URLSearchParams(window.location.search);
-    const isAutoLogin = urlParams.get('autologin');
-
-    if (savedAuth === 'true' && !isAutoLogin && !window.location.hash.includes('authenticated=true')) {{
-        // Use query param to signal auto-login to Streamlit
-        const newUrl = new URL(window.location.href);
-        newUrl.searchParams.set('autologin', 'true');
-        window.location.href = newUrl.href;
-    }}
-
-    function setAuth(status) {{
-        localStorage.setItem('anchor_authenticated', status);
-    }}
-
-    // Listen for messages from Streamlit if needed, or just poll
-    // For now, we'll just check the state and expose helper
-    window.setAnchorAuth = setAuth;
-    </script>
-    """
-    components.html(js_code, height=0)
+    # This component stays active across reruns: it is rendered on every run, logged in or not.
+    # It handles Screen Wake Lock and flushes entries saved on the device (see outbox.py);
+    # auth persistence is the signed session cookie
+    outbox.session_manager(sync=st.session_state['authenticated'])
 
+def set_session_cookie(token, max_age):
+    # The cookie rides along with the next websocket handshake, where the first run reads it
+    components.html(
+        f"<script>window.parent.document.cookie = '{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Strict';</script>",
+        height=0
+    )
 
-# --- Authentication Constants ---
-MASTER_PASSWORD = "papera70"
 
 # --- Session State Initialization ---
 if 'authenticated' not in st.session_state:
@@ -110,14 +73,20 @@ if 'authenticated' not in st.session_state:
 
 # --- Main App Logic ---
 def main():
+    # Cookie writes wait for a full run: a component emitted right before st.rerun() can be dropped
+    pending_cookie = st.session_state.pop('pending_session_cookie', None)
+    if pending_cookie:
+        set_session_cookie(*pending_cookie)
+
+    # Session resume: a valid signed cookie authenticates within this same run.
+    # The handshake cookie lives as long as the websocket, so honour logouts first.
+    if not st.session_state['authenticated'] and not st.session_state.get('logged_out') and session_from_cookie():
+        st.session_state['authenticated'] = True
+        dashboard.start_prefetch()
+
+    # After the cookie check, so a reopened page flushes its outbox on the first run
     inject_session_manager()
     
-    # Auto-login check
-    if not st.session_state['authenticated']:
-        if st.query_params.get("autologin") == "true":
-            st.session_state['authenticated'] = True
-            st.rerun()
-    
     if not st.session_state['authenticated']:
         show_login()
     else:
@@ -139,8 +108,11 @@ def show_login():
         if st.button("Enter Operations"):
             if password == MASTER_PASSWORD:
                 st.session_state['authenticated'] = True
-                # Inject JS to save to localStorage
-                components.html(f"<script>localStorage.setItem('anchor_authenticated', 'true');</script>", height=0)
+                # Warm the Dashboard cache while the login rerun completes
+                dashboard.start_prefetch()
+                st.session_state['logged_out'] = False
+                # Persist the session as a signed cookie
+                st.session_state['pending_session_cookie'] = (issue_token(), SESSION_TTL_SECONDS)
                 st.rerun()
             else:
                 st.error("Access Denied")
@@ -150,7 +122,7 @@ def show_app():
     with st.sidebar:
         st.title("⚓ The Anchor")
         st.markdown("---")
-        menu_selection = st.radio("Navigation", ["Dashboard", "Meditation", "Exercise"], index=0)
+        menu_selection = st.radio("Navigation", ["Dashboard", "Meditation", "Exercise", "History"], index=0, key="nav_page")
         
         st.markdown("---")
         
@@ -160,11 +132,18 @@ def show_app():
         else:
             st.session_state['force_offline'] = False
 
+        # Operator Tools
+        if profiler.OPERATOR_TOOLS:
+            profiler.sidebar_controls()
+            show_firestore_usage()
+
         st.markdown("---")
         if st.button("Logout"):
             st.session_state['authenticated'] = False
-            # Inject JS to clear localStorage
-            components.html(f"<script>localStorage.setItem('anchor_authenticated', 'false');</script>", height=0)
+            st.session_state.pop('dashboard_prefetch', None)
+            st.session_state['logged_out'] = True
+            # Expire the session cookie
+            st.session_state['pending_session_cookie'] = ("", 0)
             st.rerun()
 
     # Module Loading
@@ -174,6 +153,17 @@ def show_app():
         meditation.show()
     elif menu_selection == "Exercise":
         exercise.show()
+    elif menu_selection == "History":
+        history.show()
+
+def show_firestore_usage():
+    counts = metering.session_counts(metering.current_session_id())
+    st.caption("Firestore ops this session (reads / writes / deletes)")
+    for page, ops in counts.items():
+        st.caption(f"{page}: {ops['reads']} / {ops['writes']} / {ops['deletes']}")
+    st.caption(f"Process reads, last hour: {metering.hour_reads()}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Reads are billed to this session and the page the run renders
+    page = st.session_state.get('nav_page', "Dashboard") if st.session_state['authenticated'] else "Login"
+    metering.run(lambda: profiler.run(main), get_script_run_ctx().session_id, page)
\ No newline at end of file
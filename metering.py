@@ -0,0 +1,423 @@
+"""
+Firestore operation accounting: billed document reads, writes and deletes.
+
+utils.db is a MeteredClient. Queries run through db.get(query), single documents
+through db.get_document(ref) or a document reference's own get(), and every
+db.batch() counts its operations on commit. Counts are kept per run, per page and
+per session, plus process-wide per day.
+
+Budgets (0 disables either):
+- ANCHOR_RUN_READ_BUDGET   reads per script run of one session
+- ANCHOR_HOUR_READ_BUDGET  reads per rolling hour, whole process
+Once one is spent, over_budget() tells callers to serve cached data instead.
+Budgets are checked before a load, never during one: the load that crosses a
+budget completes. A run's count starts at 0, so its first load (the dashboard's
+full range query) always runs, and a run can overshoot by its largest load; the
+hourly budget does stop that first load once the hour is spent.
+
+Daily totals are written to ANCHOR_METER_DIR (default firestore_usage/) as
+<date>/<host>-<pid>.json. Compare days, or a day against a baseline:
+
+    python metering.py [--days 7]
+    python metering.py --check baseline.json [--tolerance 0.2]
+"""
+import argparse
+import atexit
+import collections
+import contextvars
+import datetime
+import glob
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from google.cloud.firestore_v1.aggregation import AggregationQuery
+
+RUN_READ_BUDGET = int(os.environ.get("ANCHOR_RUN_READ_BUDGET", "2000"))
+HOUR_READ_BUDGET = int(os.environ.get("ANCHOR_HOUR_READ_BUDGET", "50000"))
+METER_DIR = os.environ.get("ANCHOR_METER_DIR", "firestore_usage")
+FLUSH_SECONDS = 300
+SESSION_IDLE_SECONDS = 24 * 3600
+
+OPERATIONS = ("reads", "writes", "deletes")
+# Operations outside a script run (CLI tools, worker threads without a scope)
+UNSCOPED_PAGE = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "script"
+
+
+class RunScope:
+    """The session and page a script run is billed to, and its own read count."""
+
+    def __init__(self, session_id, page):
+        self.session_id = session_id
+        self.page = page
+        self.reads = 0
+
+
+_scope = contextvars.ContextVar("metering_scope", default=None)
+_lock = threading.Lock()
+_sessions = {}  # session id -> {'pages': {page: Counter}, 'seen': epoch s}
+_hour = collections.deque()  # (epoch s, reads)
+_hour_reads = 0
+_day = None
+_flushed_at = time.time()
+
+
+def _new_day():
+    return {
+        "date": datetime.date.today().isoformat(),
+        "totals": collections.Counter(),
+        "pages": collections.defaultdict(collections.Counter),
+        "run_reads": [],
+    }
+
+
+def _today():
+    """Today's stats, writing out the previous day when the date rolls over. Call under _lock."""
+    global _day
+    if _day is None or _day["date"] != datetime.date.today().isoformat():
+        if _day is not None:
+            _write_day(_day)
+        _day = _new_day()
+    return _day
+
+
+def record(reads=0, writes=0, deletes=0):
+    """Bills operations to the current run scope, its session and page, and today's totals."""
+    global _hour_reads
+    scope = _scope.get()
+    page = scope.page if scope else UNSCOPED_PAGE
+    ops = {"reads": reads, "writes": writes, "deletes": deletes}
+    now = time.time()
+    with _lock:
+        day = _today()
+        day["totals"].update(ops)
+        day["pages"][page].update(ops)
+        if scope is not None:
+            scope.reads += reads
+            session = _sessions.setdefault(scope.session_id, {"pages": collections.defaultdict(collections.Counter)})
+            session["pages"][page].update(ops)
+            session["seen"] = now
+        if reads:
+            _hour.append((now, reads))
+            _hour_reads += reads
+
+
+def hour_reads():
+    global _hour_reads
+    cutoff = time.time() - 3600
+    with _lock:
+        while _hour and _hour[0][0] < cutoff:
+            _hour_reads -= _hour.popleft()[1]
+        return _hour_reads
+
+
+def over_budget():
+    """
+    'run' or 'hour' when that read budget is spent, else None. Never limits unscoped (CLI) work.
+    Reflects reads already made: callers check it before a load, so it caps the loads after.
+    """
+    scope = _scope.get()
+    if scope is None:
+        return None
+    if RUN_READ_BUDGET and scope.reads >= RUN_READ_BUDGET:
+        return "run"
+    if HOUR_READ_BUDGET and hour_reads() >= HOUR_READ_BUDGET:
+        return "hour"
+    return None
+
+
+def session_counts(session_id):
+    """{page: {'reads', 'writes', 'deletes'}} billed to one session so far."""
+    with _lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            return {}
+        return {page: dict(counts) for page, counts in session["pages"].items()}
+
+
+def current_session_id():
+    scope = _scope.get()
+    return scope.session_id if scope else None
+
+
+# --- Client Wrapper ---
+
+class MeteredBatch:
+    """WriteBatch that bills its set/update/delete operations when committed."""
+
+    def __init__(self, batch):
+        self._batch = batch
+        self._writes = 0
+        self._deletes = 0
+
+    def set(self, ref, *args, **kwargs):
+        self._writes += 1
+        return self._batch.set(_unwrap(ref), *args, **kwargs)
+
+    def update(self, ref, *args, **kwargs):
+        self._writes += 1
+        return self._batch.update(_unwrap(ref), *args, **kwargs)
+
+    def create(self, ref, *args, **kwargs):
+        self._writes += 1
+        return self._batch.create(_unwrap(ref), *args, **kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        self._deletes += 1
+        return self._batch.delete(_unwrap(ref), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        result = self._batch.commit(*args, **kwargs)
+        record(writes=self._writes, deletes=self._deletes)
+        self._writes = self._deletes = 0
+        return result
+
+
+def _unwrap(ref):
+    return ref._target if isinstance(ref, _Metered) else ref
+
+
+class _Metered:
+    """Passes everything not metered through to the wrapped reference."""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class MeteredDocument(_Metered):
+    """DocumentReference whose direct reads and writes are billed."""
+
+    def get(self, *args, **kwargs):
+        snapshot = self._target.get(*args, **kwargs)
+        record(reads=1)
+        return snapshot
+
+    def set(self, *args, **kwargs):
+        result = self._target.set(*args, **kwargs)
+        record(writes=1)
+        return result
+
+    def update(self, *args, **kwargs):
+        result = self._target.update(*args, **kwargs)
+        record(writes=1)
+        return result
+
+    def create(self, *args, **kwargs):
+        result = self._target.create(*args, **kwargs)
+        record(writes=1)
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = self._target.delete(*args, **kwargs)
+        record(deletes=1)
+        return result
+
+    def collection(self, *args):
+        return MeteredCollection(self._target.collection(*args))
+
+
+class MeteredCollection(_Metered):
+    """CollectionReference whose documents are metered; query builders return plain queries."""
+
+    def document(self, *args):
+        return MeteredDocument(self._target.document(*args))
+
+    def get(self, *args, **kwargs):
+        results = self._target.get(*args, **kwargs)
+        record(reads=max(1, len(results)))
+        return results
+
+    def add(self, *args, **kwargs):
+        result = self._target.add(*args, **kwargs)
+        record(writes=1)
+        return result
+
+
+class MeteredClient:
+    """
+    Firestore client that bills what it executes. collection() and document()
+    return metered references, so a document's own get() is counted too; query
+    builders (where, order_by, ...) return the wrapped client's queries: execute
+    those through get(). get_document(), get_all(), add() and batch() are counted.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def collection(self, *args):
+        return MeteredCollection(self._client.collection(*args))
+
+    def document(self, *args):
+        return MeteredDocument(self._client.document(*args))
+
+    def get(self, query, timeout=None):
+        """Runs a query. A query bills one read per document, and at least one."""
+        query = _unwrap(query)
+        results = query.get(timeout=timeout)
+        # Aggregations bill per 1000 index entries scanned; the count is not returned
+        record(reads=1 if isinstance(query, AggregationQuery) else max(1, len(results)))
+        return results
+
+    def get_document(self, ref, **kwargs):
+        # A metered reference bills its own read
+        return ref.get(**kwargs) if isinstance(ref, MeteredDocument) else MeteredDocument(ref).get(**kwargs)
+
+    def get_all(self, refs, **kwargs):
+        snapshots = list(self._client.get_all([_unwrap(ref) for ref in refs], **kwargs))
+        record(reads=len(snapshots))
+        return snapshots
+
+    def add(self, collection, data):
+        return MeteredCollection(_unwrap(collection)).add(data)
+
+    def batch(self):
+        return MeteredBatch(self._client.batch())
+
+
+# --- Script Runs ---
+
+def run(fn, session_id, page):
+    """Runs one script run of `fn` billed to (session_id, page); the run's reads go to today's stats."""
+    scope = RunScope(session_id, page)
+    token = _scope.set(scope)
+    try:
+        fn()
+    finally:
+        _scope.reset(token)
+        with _lock:
+            _today()["run_reads"].append(scope.reads)
+        if time.time() - _flushed_at > FLUSH_SECONDS:
+            flush()
+
+
+def _percentile(values, q):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _summary(day):
+    run_reads = day["run_reads"]
+    return {
+        "date": day["date"],
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "totals": {op: day["totals"][op] for op in OPERATIONS},
+        "pages": {page: {op: counts[op] for op in OPERATIONS} for page, counts in day["pages"].items()},
+        "runs": len(run_reads),
+        "reads_per_run": {
+            "mean": round(sum(run_reads) / len(run_reads), 1) if run_reads else 0,
+            "p50": _percentile(run_reads, 0.5),
+            "p95": _percentile(run_reads, 0.95),
+            "max": max(run_reads, default=0),
+        },
+    }
+
+
+def _write_day(day):
+    directory = os.path.join(METER_DIR, day["date"])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{socket.gethostname()}-{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(_summary(day), f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def flush():
+    """Writes today's totals so far and forgets sessions idle for a day."""
+    global _flushed_at
+    with _lock:
+        _flushed_at = time.time()
+        for session_id, session in list(_sessions.items()):
+            if _flushed_at - session.get("seen", _flushed_at) > SESSION_IDLE_SECONDS:
+                del _sessions[session_id]
+        if _day is not None:
+            _write_day(_day)
+
+
+atexit.register(flush)
+
+
+# --- Reports ---
+
+def load_day(date):
+    """A day's totals summed over every process that wrote one."""
+    merged = {"date": date, "totals": collections.Counter(), "pages": collections.defaultdict(collections.Counter),
+              "runs": 0, "run_reads_total": 0, "p95": 0}
+    for path in glob.glob(os.path.join(METER_DIR, date, "*.json")):
+        with open(path) as f:
+            part = json.load(f)
+        merged["totals"].update(part["totals"])
+        for page, counts in part["pages"].items():
+            merged["pages"][page].update(counts)
+        merged["runs"] += part["runs"]
+        merged["run_reads_total"] += part["reads_per_run"]["mean"] * part["runs"]
+        merged["p95"] = max(merged["p95"], part["reads_per_run"]["p95"])
+    merged["reads_per_run"] = round(merged["run_reads_total"] / merged["runs"], 1) if merged["runs"] else 0
+    return merged
+
+
+def _row(day):
+    totals = day["totals"]
+    return (f"{day['date']}  reads {totals['reads']:>8}  writes {totals['writes']:>6}  "
+            f"deletes {totals['deletes']:>6}  runs {day['runs']:>6}  reads/run {day['reads_per_run']:>7}")
+
+
+def check(day, baseline, tolerance):
+    """Regressions of `day` against a baseline day: reads per run, and reads per page scaled by runs."""
+    problems = []
+    if baseline["reads_per_run"] and day["reads_per_run"] > baseline["reads_per_run"] * (1 + tolerance):
+        problems.append(f"reads/run {day['reads_per_run']} vs baseline {baseline['reads_per_run']}")
+    scale = day["runs"] / baseline["runs"] if baseline["runs"] else 1
+    for page, counts in baseline["pages"].items():
+        expected = counts["reads"] * scale
+        actual = day["pages"].get(page, {}).get("reads", 0)
+        if expected and actual > expected * (1 + tolerance):
+            problems.append(f"{page}: {actual} reads vs {round(expected)} expected")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily Firestore operation totals and cost regression check.")
+    parser.add_argument("--days", type=int, default=7, help="Days to list, most recent last")
+    parser.add_argument("--check", metavar="BASELINE", help="Baseline day (JSON from --save-baseline)")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save the most recent day as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    today = datetime.date.today()
+    days = [load_day((today - datetime.timedelta(days=n)).isoformat()) for n in range(args.days - 1, -1, -1)]
+    for day in days:
+        print(_row(day))
+
+    latest = next((day for day in reversed(days) if day["runs"]), None)
+    if args.save_baseline and latest:
+        with open(args.save_baseline, "w") as f:
+            json.dump(latest, f, indent=2)
+        print(f"Saved {latest['date']} as baseline to {args.save_baseline}")
+
+    if args.check:
+        if latest is None:
+            raise SystemExit("No metered runs to check.")
+        with open(args.check) as f:
+            baseline = json.load(f)
+        problems = check(latest, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            raise SystemExit(1)
+        print(f"{latest['date']} within {args.tolerance:.0%} of baseline {baseline['date']}.")
+
+
+if __name__ == "__main__":
+    main()
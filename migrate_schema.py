@@ -0,0 +1,66 @@
+"""
+Upgrades every document in daily_logs to the canonical schema (see schema.py).
+
+    python migrate_schema.py [--batch-size 400] [--dry-run]
+
+Documents are paged by id and rewritten in batched writes, so the job can be
+interrupted and re-run: canonical documents are skipped.
+"""
+import argparse
+
+from schema import to_canonical, is_canonical
+from utils import db, COLLECTION_NAME
+
+# Firestore caps a batched write at 500 operations
+MAX_BATCH = 500
+
+
+def migrate(batch_size=400, dry_run=False):
+    batch_size = min(batch_size, MAX_BATCH)
+    query = db.collection(COLLECTION_NAME).order_by('__name__').limit(batch_size)
+    scanned = upgraded = 0
+    last_doc = None
+
+    while True:
+        page_query = query.start_after(last_doc) if last_doc else query
+        page = db.get(page_query, timeout=30)
+        if not page:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in page:
+            data = doc.to_dict()
+            if is_canonical(data):
+                continue
+            # set() replaces the document, dropping the legacy time fields
+            batch.set(doc.reference, to_canonical(data))
+            pending += 1
+
+        if pending and not dry_run:
+            batch.commit()
+
+        scanned += len(page)
+        upgraded += pending
+        last_doc = page[-1]
+        print(f"Scanned {scanned} documents, upgraded {upgraded}")
+
+    return scanned, upgraded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade daily_logs to the canonical schema.")
+    parser.add_argument("--batch-size", type=int, default=400)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    if db is None:
+        raise SystemExit("Firestore is not configured.")
+
+    scanned, upgraded = migrate(args.batch_size, args.dry_run)
+    verb = "Would upgrade" if args.dry_run else "Upgraded"
+    print(f"Done. {verb} {upgraded} of {scanned} documents.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,77 +3,355 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+import contextvars
+import copy
 import datetime
-from utils import get_logs, save_log
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metering
+import snapshot
+from outbox import save_button
+from modules.metrics import (
+    prepare_logs, split_by_type, compute_kpis, per_day, daily_totals, activity_breakdown,
+    TrendSeries, ROLLING_WINDOWS
+)
+from utils import (
+    is_online, report_db_error, fetch_remote, log_queries,
+    latest_weight_query, filter_logs, latest_weight, kpi_queries, kpi_totals,
+    archived_logs, newest_first, history_revision, history_changed_days, LOG_TYPES
+)
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WEIGHT = 78.0
+TIME_RANGES = {"7 Days": 7, "30 Days": 30, "90 Days": 90, "All Time": None}
+DEFAULT_RANGE = "7 Days"
+
+# Projections: chart queries fetch only the fields they plot
+CHART_FIELDS = {
+    "meditation": ["type", "ts_ms", "tz_offset_min", "duration_minutes"],
+    "exercise": ["type", "ts_ms", "tz_offset_min", "activity", "duration_minutes", "calories"],
+    "weight": ["type", "ts_ms", "tz_offset_min", "weight"],
+}
+
+# Shared by all sessions; one warm-up job per login
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dashboard-prefetch")
+
+# Closed-day trend series, shared by all sessions and replaced, never modified, when days close or change
+_trends = {'series': None, 'revision': None, 'updating': False}
+_trends_lock = threading.Lock()
+
+def range_start(filter_option, today):
+    days = TIME_RANGES[filter_option]
+    return today - datetime.timedelta(days=days) if days else None # None = All time
+
+def fetch_data(start_date, activity, local_logs, online=True):
+    """
+    Loads one time range with every query in flight at once:
+    - a range-bounded, projected query per log type for the charts,
+      plus the monthly archives covering the range
+    - a limit(1) query for the latest weight (form default)
+    - aggregation queries for the KPI tiles
+    Returns {'df', 'weight', 'kpis'}; 'kpis' is None when offline.
+    Takes local logs explicitly so it can run on a worker thread.
+    """
+    if online and snapshot.enabled():
+        return fetch_from_snapshot(start_date, local_logs)
+
+    remote = {}
+    if online:
+        queries = log_queries(start_date=start_date, fields=CHART_FIELDS)
+        queries['latest_weight'] = latest_weight_query()
+        queries.update(kpi_queries(start_date, None if activity == "All" else activity))
+        remote = fetch_remote(queries)
+
+    kpis = None
+    if remote:
+        kpis = kpi_totals(remote, local_logs, start_date, None if activity == "All" else activity)
+
+    archived = archived_logs(remote, start_date)
+    weight = latest_weight(remote.get('latest_weight') or newest_first(archived, 'weight'), local_logs)
+    raw_logs = [log for log_type in LOG_TYPES for log in remote.get(log_type, [])]
+    raw_logs += archived
+    raw_logs += filter_logs(local_logs, start_date=start_date)
+
+    return {
+        'df': prepare_logs(raw_logs),
+        'weight': weight if weight is not None else DEFAULT_WEIGHT,
+        'kpis': kpis,
+    }
+
+def fetch_from_snapshot(start_date, local_logs):
+    """
+    Same result as fetch_data, served from the host-local history snapshot (ANCHOR_SNAPSHOT=1).
+    Only writes since the last refresh are read from Firestore; KPIs use the pandas path,
+    with the activity filter applied in memory by show().
+    """
+    history = snapshot.load_history(start_date)
+    local = pd.DataFrame(filter_logs(local_logs, start_date=start_date))
+    weight = latest_weight(snapshot.latest_rows('weight'), local_logs)
+    return {
+        'df': prepare_logs(pd.concat([history, local], ignore_index=True)),
+        'weight': weight if weight is not None else DEFAULT_WEIGHT,
+        'kpis': None,
+    }
+
+def _warm_up(local_logs):
+    start_date = range_start(DEFAULT_RANGE, datetime.datetime.now())
+    return (DEFAULT_RANGE, "All"), fetch_data(start_date, "All", local_logs)
+
+def start_prefetch():
+    """
+    Called right after authentication: loads the default time range and
+    prepares the DataFrame on a background thread while the login rerun completes.
+    """
+    st.session_state['dashboard_login_at'] = time.perf_counter()
+    if not is_online():
+        return
+    # Snapshot local logs here: session state is not reachable from the worker
+    local_logs = list(st.session_state.get('offline_logs', []))
+    # The copied context bills the warm-up reads to this session
+    st.session_state['dashboard_prefetch'] = _prefetch_pool.submit(contextvars.copy_context().run, _warm_up, local_logs)
+
+def load_data(filter_option, start_date, activity):
+    """
+    Returns the fetch_data dict, consuming the login warm-up if it covers these filters.
+    A failed warm-up falls back to the regular load, which reports the error.
+    """
+    # Reruns from the weight input change nothing the dashboard shows: reuse the last load
+    if st.session_state.pop('dashboard_reuse', False):
+        cached = st.session_state.get('dashboard_cache', {}).get((filter_option, activity))
+        if cached is not None:
+            return cached[1]
+
+    future = st.session_state.pop('dashboard_prefetch', None)
+    if future is not None:
+        try:
+            warm_filters, data = future.result()
+            if warm_filters == (filter_option, activity):
+                remember_data(filter_option, activity, data)
+                return data
+        except Exception:
+            # Not reported to the user: the regular load below retries, and reports if it fails too
+            log.warning("Dashboard warm-up failed; loading synchronously", exc_info=True)
+
+    local_logs = st.session_state.get('offline_logs', [])
+    if is_online():
+        budget = metering.over_budget()
+        if budget:
+            return cached_data(filter_option, start_date, activity, budget, local_logs)
+        try:
+            with st.spinner("Loading Operations Data..."):
+                data = fetch_data(start_date, activity, local_logs)
+            remember_data(filter_option, activity, data)
+            return data
+        except Exception as e:
+            report_db_error(e)
+    return fetch_data(start_date, activity, local_logs, online=False)
+
+def remember_data(filter_option, activity, data):
+    """Keeps the last online load per filter pair, served while a read budget is spent."""
+    cache = st.session_state.setdefault('dashboard_cache', {})
+    cache[(filter_option, activity)] = (datetime.datetime.now(), data)
+
+def cached_data(filter_option, start_date, activity, budget, local_logs):
+    cached = st.session_state.get('dashboard_cache', {}).get((filter_option, activity))
+    if cached is None:
+        st.warning(f"📉 Firestore {budget} read budget spent: showing entries from this session only.")
+        return fetch_data(start_date, activity, local_logs, online=False)
+    loaded_at, data = cached
+    st.caption(f"📉 Firestore {budget} read budget spent: showing data loaded at {loaded_at:%H:%M}.")
+    return data
+
+def closed_day_rows(start_day, end_day):
+    """Synced rows of the local days [start_day, end_day] as a prepared DataFrame; start_day None = all."""
+    start = datetime.datetime.combine(start_day, datetime.time()) if start_day else None
+    end = datetime.datetime.combine(end_day, datetime.time.max)
+    if snapshot.enabled():
+        rows = snapshot.load_history(start)
+    else:
+        remote = fetch_remote(log_queries(start_date=start, end_date=end, fields=CHART_FIELDS))
+        rows = [log for log_type in LOG_TYPES for log in remote[log_type]]
+        rows += archived_logs(remote, start, end)
+    df = prepare_logs(rows)
+    return df[df['datetime'] <= end] if not df.empty else df
+
+def changed_days(built_for):
+    """Closed days changed since the series was built for `built_for`, or None if unknown."""
+    local_revision, snapshot_revision = built_for
+    days = history_changed_days(local_revision)
+    if days is not None and snapshot_revision is not None:
+        shared = snapshot.changed_days(snapshot_revision)
+        days = None if shared is None else days + shared
+    return days
+
+def updated_series(series, built_for, revision, yesterday, today):
+    """
+    A new series current through yesterday. The cached one is copied, cut back to
+    the earliest day changed since it was built, and extended from there: a
+    backdated entry re-reads the days since its date, not the whole history.
+    A full read only for the first build, or when that day is unknown or earlier
+    than the series.
+    """
+    if series is not None:
+        days = changed_days(built_for) if built_for != revision else []
+        series = copy.deepcopy(series)
+        if days is None or (days and not series.truncate(min(days))):
+            series = None
+    if series is None:
+        history = closed_day_rows(None, yesterday)
+        first_day = history['datetime'].min().date() if not history.empty else today
+        series = TrendSeries(first_day)
+        series.extend(history, yesterday)
+    elif series.last_day < yesterday:
+        series.extend(closed_day_rows(series.last_day + datetime.timedelta(days=1), yesterday), yesterday)
+    return series
+
+def trend_revision():
+    # The snapshot's revision carries backdated writes made by other server processes
+    return (history_revision(), snapshot.revision() if snapshot.enabled() else None)
+
+def load_trends(df, today, range_days):
+    """
+    Trend summary (see TrendSeries.summary) for the dashboard panels.
+    History is read in full once per process; after that only the days closed
+    since the last call are fetched and appended, and writes dated before today
+    re-read the days from the earliest one changed. Today's rows, local ones
+    included, come from `df`.
+    One session updates the shared series at a time, outside the lock, and
+    swaps it in when done; meanwhile, offline or over the read budget, a series
+    missing only backdated writes is still served. Returns None when no usable
+    series can be loaded.
+    """
+    yesterday = today - datetime.timedelta(days=1)
+    with _trends_lock:
+        series, built_for = _trends['series'], _trends['revision']
+        revision = trend_revision()
+        current = series is not None and built_for == revision and series.last_day >= yesterday
+        if not current and not _trends['updating'] and is_online() and not metering.over_budget():
+            _trends['updating'] = True
+            update = True
+        else:
+            update = False
+
+    if update:
+        try:
+            series = updated_series(series, built_for, revision, yesterday, today)
+        except Exception as e:
+            with _trends_lock:
+                _trends['updating'] = False
+            report_db_error(e)
+            return None
+        with _trends_lock:
+            _trends.update(series=series, revision=revision, updating=False)
+
+    if series is None or series.last_day < yesterday:
+        return None
+    # Installed series are never modified, only replaced
+    return series.summary(df, today, range_days)
+
+def show_trends(trends):
+    st.markdown("### Trends")
+    st.caption("All activities, from the full history.")
+
+    t_cols = st.columns(3)
+    for col, kind, label in zip(t_cols, ("meditation", "exercise"), ("Mindfulness", "Exercise")):
+        streak = trends['streaks'][kind]
+        rolling = trends['rolling'][kind]
+        with col:
+            st.metric(
+                label=f"{label} Streak",
+                value=f"{streak['current']} days",
+                delta=f"Best {streak['longest']}",
+                delta_color="off"
+            )
+            st.caption(" · ".join(f"{days}d avg {rolling[days]:.0f} min" for days in ROLLING_WINDOWS))
+    with t_cols[2]:
+        rate = trends['weight_rate']
+        st.metric(
+            label="Weight Trend",
+            value=f"{rate:+} kg/wk" if rate is not None else "—",
+            help="Least-squares fit over the selected range"
+        )
+
+    chart = trends['chart']
+    fig_roll = go.Figure()
+    colors = {"meditation": '#2ea043', "exercise": '#db6d28'}
+    for kind in ("meditation", "exercise"):
+        for days in ROLLING_WINDOWS:
+            fig_roll.add_trace(go.Scatter(
+                x=chart['datetime'],
+                y=chart[f"{kind}_{days}d"],
+                name=f"{kind.capitalize()} {days}d avg",
+                line=dict(color=colors[kind], width=3 if days == ROLLING_WINDOWS[0] else 1.5,
+                          dash='solid' if days == ROLLING_WINDOWS[0] else 'dot'),
+                mode='lines'
+            ))
+    fig_roll.update_layout(
+        template="plotly_dark",
+        font=dict(color="white"),
+        legend=dict(x=0, y=1.1, orientation="h", font=dict(color="white"), bgcolor="rgba(0,0,0,0)"),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        margin=dict(l=0, r=0, t=30, b=0),
+        yaxis_title="Minutes / Day"
+    )
+    st.plotly_chart(fig_roll, use_container_width=True)
+
+def report_first_chart():
+    """Shows time from login to the first rendered chart, once per login."""
+    login_at = st.session_state.pop('dashboard_login_at', None)
+    if login_at is not None:
+        st.caption(f"⚡ First chart ready {time.perf_counter() - login_at:.2f}s after login")
 
 def show():
     st.header("Operations Dashboard")
 
+    # The filters render below the weight form, but their values decide what to fetch
+    filter_option = st.session_state.get('dash_range', DEFAULT_RANGE)
+    queried_activity = st.session_state.get('dash_activity', "All")
+    today = datetime.datetime.now()
+    start_date = range_start(filter_option, today)
+
     # --- Fetch Data & calculate defaults ---
-    with st.spinner("Loading Operations Data..."):
-        raw_logs = get_logs()
-    
-    # Process basic DF for defaults (before filtering)
-    df = pd.DataFrame(raw_logs)
-    last_known_weight = 78.0
-    
-    if not df.empty:
-        # Ensure datetime conversion early
-        if 'datetime' not in df.columns and 'timestamp' in df.columns:
-             df['datetime'] = pd.to_datetime(df['timestamp']).dt.tz_localize(None)
-        elif 'datetime' in df.columns:
-             df['datetime'] = pd.to_datetime(df['datetime'], utc=True).dt.tz_convert(None)
-        
-        # Find latest weight
-        w_df = df[df['type'] == 'weight']
-        if not w_df.empty:
-            last_known_weight = w_df.sort_values('datetime', ascending=False).iloc[0]['weight']
+    data = load_data(filter_option, start_date, queried_activity)
+    df = data['df']
+    last_known_weight = data['weight']
 
     # --- Quick Actions (Weight Log) ---
     with st.expander("Update Body Metrics"):
-        with st.form("weight_form"):
-            new_weight = st.number_input("Current Weight (kg)", min_value=40.0, max_value=150.0, step=0.1, value=float(last_known_weight))
-            submitted = st.form_submit_button("Update Weight")
-            if submitted:
-                save_log({
-                    "type": "weight",
-                    "weight": new_weight,
-                    "completed_at": datetime.datetime.now()
-                })
-                st.success("Weight updated.")
-                st.rerun()
+        # No form around it (see save_button): each step reruns, served from dashboard_cache
+        new_weight = st.number_input(
+            "Current Weight (kg)", min_value=40.0, max_value=150.0, step=0.1, value=float(last_known_weight),
+            on_change=lambda: st.session_state.update(dashboard_reuse=True)
+        )
+        # Queued on the device first; stamped with the click time
+        if save_button("Update Weight", {"type": "weight", "weight": new_weight}, key="weight_save"):
+            st.success("Weight updated.")
+            st.rerun()
 
     # --- Filters ---
     st.subheader("Performance Overview")
-    
-    if df.empty:
-        st.info("No data available yet. Start by logging a session!")
-        return
 
     # Filter Layout
     f_col1, f_col2 = st.columns(2)
     with f_col1:
-        filter_option = st.select_slider(
+        st.select_slider(
             "Time Range",
-            options=["7 Days", "30 Days", "90 Days", "All Time"],
-            value="7 Days"
+            options=list(TIME_RANGES),
+            value=DEFAULT_RANGE,
+            key="dash_range"
         )
     
-    # Calculate Date Range
-    today = datetime.datetime.now()
-    if filter_option == "7 Days":
-        start_date = today - datetime.timedelta(days=7)
-    elif filter_option == "30 Days":
-        start_date = today - datetime.timedelta(days=30)
-    elif filter_option == "90 Days":
-        start_date = today - datetime.timedelta(days=90)
-    else:
-        start_date = None # All time
-    
-    # Base Data Filtering (Time)
-    filtered_df = df.copy()
-    if start_date:
-        filtered_df = filtered_df[filtered_df['datetime'] >= start_date]
+    if df.empty:
+        st.session_state.pop('dashboard_login_at', None)
+        st.info("No data available for this range yet. Start by logging a session!")
+        return
+
+    # Queries are already bounded to the selected range
+    filtered_df = df
 
     # Extract available activities for filter
     available_activities = ["All"]
@@ -85,8 +363,12 @@ def show():
             ex_types.sort()
             available_activities.extend(ex_types)
 
+    # A previous selection may not exist in the new range
+    if st.session_state.get('dash_activity') not in available_activities:
+        st.session_state.pop('dash_activity', None)
+
     with f_col2:
-        activity_filter = st.selectbox("Exercise Type", available_activities, index=0)
+        activity_filter = st.selectbox("Exercise Type", available_activities, index=0, key="dash_activity")
 
     # Apply Activity Filter
     if activity_filter != "All":
@@ -96,17 +378,17 @@ def show():
         ]
 
     # --- Processing Data ---
-    meditation_df = filtered_df[filtered_df['type'] == 'meditation'].copy()
-    exercise_df = filtered_df[filtered_df['type'] == 'exercise'].copy()
-    weight_df = filtered_df[filtered_df['type'] == 'weight'].copy()
+    meditation_df, exercise_df, weight_df = split_by_type(filtered_df)
 
     # --- KPIs ---
+    kpis = data['kpis']
+    if kpis is None or activity_filter != queried_activity:
+        kpis = compute_kpis(weight_df, exercise_df, meditation_df)
+
     kpi_cols = st.columns(4)
     
     # 1. Weight KPI
-    current_weight = 0
-    if not weight_df.empty:
-        current_weight = weight_df.sort_values('datetime', ascending=False).iloc[0]['weight']
+    current_weight = kpis['weight']
     
     with kpi_cols[0]:
         st.metric(
@@ -127,31 +409,25 @@ def show():
     is_all_time = (filter_option == "All Time")
 
     # 2. Calories KPI
-    metric_cal = 0
     label_cal = "Total Kcal" if is_all_time else "Avg Kcal/Day"
-    if not exercise_df.empty:
-        total_calories = exercise_df['calories'].sum()
-        metric_cal = total_calories if is_all_time else int(total_calories / days)
+    total_calories = kpis['calories']
+    metric_cal = total_calories if is_all_time else per_day(total_calories, days)
 
     with kpi_cols[1]:
         st.metric(label=label_cal, value=f"{metric_cal}")
 
     # 3. Exercise Minutes KPI
-    metric_ex_min = 0
     label_ex_min = "Ex. Minutes" if is_all_time else "Avg Ex. Min/Day"
-    if not exercise_df.empty:
-        total_ex_mins = exercise_df['duration_minutes'].sum()
-        metric_ex_min = total_ex_mins if is_all_time else int(total_ex_mins / days)
+    total_ex_mins = kpis['exercise_minutes']
+    metric_ex_min = total_ex_mins if is_all_time else per_day(total_ex_mins, days)
 
     with kpi_cols[2]:
         st.metric(label=label_ex_min, value=f"{metric_ex_min} min")
 
     # 4. Meditation KPI
-    metric_med = 0
     label_med = "Mindfulness" if is_all_time else "Avg Mind/Day"
-    if not meditation_df.empty:
-        total_meditation = meditation_df['duration_minutes'].sum()
-        metric_med = total_meditation if is_all_time else int(total_meditation / days)
+    total_meditation = kpis['meditation_minutes']
+    metric_med = total_meditation if is_all_time else per_day(total_meditation, days)
 
     with kpi_cols[3]:
         st.metric(label=label_med, value=f"{metric_med} min")
@@ -165,7 +441,7 @@ def show():
 
     # 1. Meditation (Primary Y)
     if not meditation_df.empty:
-        med_daily = meditation_df.groupby(meditation_df['datetime'].dt.date)['duration_minutes'].sum().reset_index()
+        med_daily = daily_totals(meditation_df, 'duration_minutes')
         fig.add_trace(go.Bar(
             x=med_daily['datetime'],
             y=med_daily['duration_minutes'],
@@ -176,7 +452,7 @@ def show():
 
     # 2. Exercise Minutes (Primary Y)
     if not exercise_df.empty:
-        ex_daily = exercise_df.groupby(exercise_df['datetime'].dt.date)['duration_minutes'].sum().reset_index()
+        ex_daily = daily_totals(exercise_df, 'duration_minutes')
         fig.add_trace(go.Bar(
             x=ex_daily['datetime'],
             y=ex_daily['duration_minutes'],
@@ -186,7 +462,7 @@ def show():
         ), secondary_y=False)
         
         # 3. Exercise Calories (Secondary Y)
-        ex_cal_daily = exercise_df.groupby(exercise_df['datetime'].dt.date)['calories'].sum().reset_index()
+        ex_cal_daily = daily_totals(exercise_df, 'calories')
         fig.add_trace(go.Scatter(
             x=ex_cal_daily['datetime'],
             y=ex_cal_daily['calories'],
@@ -216,6 +492,12 @@ def show():
         fig.update_yaxes(title_text="Calories", secondary_y=True, title_font=dict(color="#ff4b4b"), tickfont=dict(color="#ff4b4b"))
 
     st.plotly_chart(fig, use_container_width=True)
+    report_first_chart()
+
+    # --- Trends ---
+    trends = load_trends(df, today.date(), TIME_RANGES[filter_option])
+    if trends is not None:
+        show_trends(trends)
 
     # Lower Row Charts
     c1, c2 = st.columns(2)
@@ -223,7 +505,7 @@ def show():
     with c1:
         st.markdown("### Exercise Distribution")
         if not exercise_df.empty:
-            pie_df = exercise_df.groupby('activity')['duration_minutes'].sum().reset_index()
+            pie_df = activity_breakdown(exercise_df)
             fig_pie = px.pie(
                 pie_df, 
                 values='duration_minutes', 
@@ -254,6 +536,15 @@ def show():
                 template="plotly_dark"
             )
             fig_weight.update_traces(line_color='#58a6ff')
+            if trends is not None and trends['weight_fit'] is not None:
+                fit = trends['weight_fit']
+                fig_weight.add_trace(go.Scatter(
+                    x=fit['datetime'],
+                    y=fit['weight'],
+                    name="Trend",
+                    line=dict(color='#8b949e', dash='dash'),
+                    mode='lines'
+                ))
             fig_weight.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)")
             st.plotly_chart(fig_weight, use_container_width=True)
         else:
@@ -1,7 +1,42 @@
 import streamlit as st
+import pandas as pd
 import time
 import datetime
-from utils import save_exercise_session
+import sensor_ingest
+from outbox import save_button
+from utils import get_latest_weight
+from modules.dashboard import DEFAULT_WEIGHT
+
+ACTIVITIES = [
+    "Corsa sul posto", "Routine addominali", "E-bike", 
+    "Cyclette", "Tapis roulant", "Camminata fuori", 
+    "Vario", "Marcia sul posto", "Stretching"
+]
+
+def show_live_sensors(token):
+    """Latest readings of the open ingest session; samples arrive outside the rerun loop."""
+    count, values = sensor_ingest.latest(token)
+    s1, s2, s3 = st.columns(3)
+    for col, name, label, unit in ((s1, 'hr', "Heart Rate", "bpm"), (s2, 'cadence', "Cadence", "rpm"), (s3, 'power', "Power", "W")):
+        with col:
+            value = values.get(name)
+            st.metric(label, f"{value:.0f} {unit}" if value is not None else "—")
+    host = st.context.headers.get("Host", "localhost").split(":")[0]
+    st.caption(f"📡 {count} samples · device feed: POST {sensor_ingest.samples_url(token, host)}")
+
+def show_sensor_summary(summary):
+    s1, s2, s3 = st.columns(3)
+    with s1:
+        st.metric("Avg Heart Rate", f"{summary['avg_hr']:.0f} bpm" if 'avg_hr' in summary else "—",
+                  delta=f"max {summary['max_hr']:.0f}" if 'max_hr' in summary else None, delta_color="off")
+    with s2:
+        st.metric("Avg Power", f"{summary['avg_power']:.0f} W" if 'avg_power' in summary else "—",
+                  delta=f"{summary['work_kj']} kJ" if 'work_kj' in summary else None, delta_color="off")
+    with s3:
+        st.metric("Moving Time", f"{summary['duration_s'] // 60} min", delta=f"{summary['samples']} samples", delta_color="off")
+    series = pd.DataFrame(summary['series']).set_index('t')
+    if not series.empty:
+        st.line_chart(series)
 
 def show():
     st.header("Physical Operations")
@@ -26,15 +61,9 @@ def show():
     if st.session_state['ex_activity'] is None:
         st.subheader("Select Protocol")
         
-        activities = [
-            "Corsa sul posto", "Routine addominali", "E-bike", 
-            "Cyclette", "Tapis roulant", "Camminata fuori", 
-            "Vario", "Marcia sul posto", "Stretching"
-        ]
-        
         # Grid Layout
         cols = st.columns(3)
-        for i, activity in enumerate(activities):
+        for i, activity in enumerate(ACTIVITIES):
             with cols[i % 3]:
                 if st.button(f"🏃 {activity}", key=activity, use_container_width=True):
                     st.session_state['ex_activity'] = activity
@@ -57,12 +86,21 @@ def show():
                 
                 st.markdown(f"<h1 style='text-align: center; color: #ff4b4b;'>{timer_str}</h1>", unsafe_allow_html=True)
                 st.info("⏱ Operation in progress...")
+                if st.session_state.get('ex_sensor'):
+                    show_live_sensors(st.session_state['ex_sensor'])
                 
                 if st.button("⏹ STOP & REVIEW", type="secondary", use_container_width=True):
                     end_time = time.time()
                     elapsed = end_time - st.session_state['ex_start_time']
                     st.session_state['ex_duration'] = int(elapsed / 60) # Minutes
                     st.session_state['ex_start_time'] = None # Reset Timer
+                    token = st.session_state.pop('ex_sensor', None)
+                    if token:
+                        summary = sensor_ingest.close_session(token, get_latest_weight() or DEFAULT_WEIGHT)
+                        st.session_state['ex_sensor_summary'] = summary
+                        if summary:
+                            # Moving time from the samples: pauses don't count
+                            st.session_state['ex_duration'] = max(1, round(summary['duration_s'] / 60))
                     st.rerun()
                 
                 # Auto-refresh loop
@@ -78,14 +116,22 @@ def show():
                 
                 st.markdown("### Finalize Log")
                 
+                summary = st.session_state.get('ex_sensor_summary')
+                sensor_calories = summary.get('calories') if summary else None
+                if summary:
+                    show_sensor_summary(summary)
+
                 # Sync temp duration if not set
                 if st.session_state['ex_temp_duration'] == 0:
                     st.session_state['ex_temp_duration'] = max(1, st.session_state['ex_duration'])
-                    st.session_state['ex_temp_calories'] = int(st.session_state['ex_temp_duration'] * 7)
+                    st.session_state['ex_temp_calories'] = (
+                        sensor_calories if sensor_calories is not None else int(st.session_state['ex_temp_duration'] * 7)
+                    )
 
-                # Callback for duration change
+                # Callback for duration change; measured calories don't follow the duration
                 def on_review_duration_change():
-                    st.session_state['ex_temp_calories'] = int(st.session_state['ex_temp_duration'] * 7)
+                    if sensor_calories is None:
+                        st.session_state['ex_temp_calories'] = int(st.session_state['ex_temp_duration'] * 7)
 
                 new_duration = st.number_input(
                     "Confirm Duration (Minutes)", 
@@ -103,17 +149,25 @@ def show():
                 
                 col1, col2 = st.columns(2)
                 with col1:
-                    if st.button("✅ SAVE & SYNC", type="primary", use_container_width=True):
-                        if save_exercise_session(activity, st.session_state['ex_temp_duration'], st.session_state['ex_temp_calories']):
-                            st.success(f"Data synchronized.")
-                            st.session_state['ex_activity'] = None
-                            st.session_state['ex_duration'] = 0
-                            st.session_state['ex_temp_duration'] = 0
-                            st.session_state['ex_temp_calories'] = 0
-                            time.sleep(1)
-                            st.rerun()
+                    # Queued on the device first: the click survives a dropped connection
+                    # The sensor summary stays on the server; the browser only queues a reference
+                    if save_button("✅ SAVE & SYNC", {
+                        "type": "exercise",
+                        "activity": activity,
+                        "duration_minutes": st.session_state['ex_temp_duration'],
+                        "calories": st.session_state['ex_temp_calories'],
+                    }, key="ex_save", attach={"sensor": summary} if summary else None):
+                        st.success(f"Data synchronized.")
+                        st.session_state.pop('ex_sensor_summary', None)
+                        st.session_state['ex_activity'] = None
+                        st.session_state['ex_duration'] = 0
+                        st.session_state['ex_temp_duration'] = 0
+                        st.session_state['ex_temp_calories'] = 0
+                        time.sleep(1)
+                        st.rerun()
                 with col2:
                     if st.button("🗑 DISCARD", use_container_width=True):
+                        st.session_state.pop('ex_sensor_summary', None)
                         st.session_state['ex_activity'] = None
                         st.session_state['ex_duration'] = 0
                         st.session_state['ex_temp_duration'] = 0
@@ -127,8 +181,16 @@ def show():
             with tab_timer:
                 st.markdown(f"### Live {activity}")
                 st.markdown("<h1 style='text-align: center; color: #8b949e;'>00:00:00</h1>", unsafe_allow_html=True)
+                if activity in sensor_ingest.SENSOR_ACTIVITIES:
+                    st.caption("📡 Heart rate, cadence and power from your device are recorded while the timer runs.")
                 if st.button("▶ START SESSION", type="primary", use_container_width=True):
                     st.session_state['ex_start_time'] = time.time()
+                    if activity in sensor_ingest.SENSOR_ACTIVITIES:
+                        try:
+                            st.session_state['ex_sensor'] = sensor_ingest.open_session(activity)
+                        except OSError as e:
+                            # Port taken (e.g. another instance): the timer still works
+                            st.toast(f"Sensor ingest unavailable: {e}")
                     st.rerun()
             
             with tab_manual:
@@ -154,25 +216,29 @@ def show():
                     key="man_calories"
                 )
                 
-                if st.button("💾 SAVE MANUAL ENTRY", type="primary", use_container_width=True):
-                    # Convert Date to Datetime (Streamlit date_input returns datetime.date)
-                    dt_log = datetime.datetime.combine(log_date, datetime.time(12, 0))
-                    if save_exercise_session(
-                        activity, 
-                        st.session_state['man_duration'], 
-                        st.session_state['man_calories'], 
-                        custom_date=dt_log
-                    ):
-                        st.success(f"Manual log saved for {log_date}")
-                        st.session_state['ex_activity'] = None
-                        # Reset values for next manual entry
-                        del st.session_state['man_duration']
-                        del st.session_state['man_calories']
-                        time.sleep(1)
-                        st.rerun()
+                # Convert Date to Datetime (Streamlit date_input returns datetime.date)
+                dt_log = datetime.datetime.combine(log_date, datetime.time(12, 0))
+                if save_button("💾 SAVE MANUAL ENTRY", {
+                    "type": "exercise",
+                    "activity": activity,
+                    "duration_minutes": st.session_state['man_duration'],
+                    "calories": st.session_state['man_calories'],
+                    "completed_at": dt_log,
+                }, key="ex_manual_save"):
+                    st.success(f"Manual log saved for {log_date}")
+                    st.session_state['ex_activity'] = None
+                    # Reset values for next manual entry
+                    del st.session_state['man_duration']
+                    del st.session_state['man_calories']
+                    time.sleep(1)
+                    st.rerun()
 
         st.markdown("---")
         if st.button("⬅ Back to Protocols"):
+            token = st.session_state.pop('ex_sensor', None)
+            if token:
+                sensor_ingest.close_session(token, DEFAULT_WEIGHT)
+            st.session_state.pop('ex_sensor_summary', None)
             st.session_state['ex_activity'] = None
             st.session_state['ex_start_time'] = None
             st.session_state['ex_duration'] = 0
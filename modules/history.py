@@ -0,0 +1,182 @@
+import streamlit as st
+import datetime
+import metering
+from schema import local_datetime
+from modules.exercise import ACTIVITIES
+from utils import (
+    history_page, update_log, delete_log, is_online, report_db_error, history_revision, HISTORY_PAGE_SIZE
+)
+
+TYPE_FILTERS = {"All": None, "Meditation": "meditation", "Exercise": "exercise", "Weight": "weight"}
+TYPE_ICONS = {"meditation": "🧘", "exercise": "🏃", "weight": "⚖️"}
+
+def reset_pages():
+    """Filters changed: back to the first page."""
+    st.session_state['hist_cursors'] = [None]
+    st.session_state.pop('hist_rows', None)
+    st.session_state.pop('hist_editing', None)
+    st.session_state.pop('hist_confirm_delete', None)
+
+def load_page(log_type, activity):
+    """
+    The current page, read once per (filters, page, history revision) and kept in
+    session state, so reruns that only open an editor cost no reads.
+    Only this page's rows are held, however long the history is.
+    """
+    cursors = st.session_state.setdefault('hist_cursors', [None])
+    key = (log_type, activity, len(cursors), history_revision())
+    cached = st.session_state.get('hist_rows')
+    if cached is not None and cached['key'] == key:
+        return cached['rows'], cached['next']
+
+    budget = metering.over_budget()
+    if budget:
+        st.caption(f"📉 Firestore {budget} read budget spent: showing the last page loaded.")
+        return (cached['rows'], cached['next']) if cached else ([], None)
+
+    rows, next_cursor = history_page(log_type, activity, cursors[-1])
+    st.session_state['hist_rows'] = {'key': key, 'rows': rows, 'next': next_cursor}
+    return rows, next_cursor
+
+def describe(row):
+    if row['type'] == 'meditation':
+        return f"{row.get('duration_minutes', 0)} min"
+    if row['type'] == 'exercise':
+        text = f"{row.get('activity', '—')} · {row.get('duration_minutes', 0)} min · {row.get('calories', 0)} kcal"
+        sensor = row.get('sensor') or {}
+        if 'avg_hr' in sensor:
+            text += f" · ❤️ {sensor['avg_hr']:.0f} bpm"
+        return text
+    return f"{row.get('weight')} kg"
+
+def after_change():
+    # The page still holds the old entry; update_log / delete_log refresh the snapshot
+    st.session_state.pop('hist_rows', None)
+    st.session_state.pop('hist_editing', None)
+    st.session_state.pop('hist_confirm_delete', None)
+
+def edit_form(row):
+    when = local_datetime(row['ts_ms'], row['tz_offset_min'])
+    with st.form(f"hist_edit_{row['id']}"):
+        c1, c2 = st.columns(2)
+        with c1:
+            new_date = st.date_input("Date", value=when.date())
+        with c2:
+            new_time = st.time_input("Time", value=when.time().replace(microsecond=0))
+
+        data = {"type": row['type']}
+        if row['type'] == 'exercise':
+            options = ACTIVITIES if row.get('activity') in ACTIVITIES else [row.get('activity'), *ACTIVITIES]
+            data['activity'] = st.selectbox("Activity", options, index=options.index(row.get('activity')))
+        if row['type'] in ('meditation', 'exercise'):
+            data['duration_minutes'] = st.number_input("Duration (Minutes)", min_value=1, value=int(row.get('duration_minutes') or 1))
+        if row['type'] == 'exercise':
+            data['calories'] = st.number_input("Calories Burned", min_value=0, step=10, value=int(row.get('calories') or 0))
+        if row['type'] == 'weight':
+            data['weight'] = st.number_input("Weight (kg)", min_value=40.0, max_value=150.0, step=0.1, value=float(row['weight']))
+
+        c1, c2 = st.columns(2)
+        with c1:
+            saved = st.form_submit_button("💾 SAVE CHANGES", use_container_width=True)
+        with c2:
+            cancelled = st.form_submit_button("Cancel", use_container_width=True)
+
+    if cancelled:
+        st.session_state.pop('hist_editing', None)
+        st.rerun()
+    if saved:
+        data['completed_at'] = datetime.datetime.combine(new_date, new_time)
+        try:
+            update_log(row['id'], row, data)
+        except Exception as e:
+            report_db_error(e)
+            return
+        after_change()
+        st.success("Entry updated.")
+        st.rerun()
+
+def confirm_delete(row):
+    st.warning(f"Delete {row['type']} entry ({describe(row)})? This cannot be undone.")
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("🗑 DELETE", key=f"hist_del_yes_{row['id']}", use_container_width=True):
+            try:
+                delete_log(row['id'], row)
+            except Exception as e:
+                report_db_error(e)
+                return
+            after_change()
+            st.success("Entry deleted.")
+            st.rerun()
+    with c2:
+        if st.button("Keep", key=f"hist_del_no_{row['id']}", use_container_width=True):
+            st.session_state.pop('hist_confirm_delete', None)
+            st.rerun()
+
+def show():
+    st.header("Operations Log")
+
+    if not is_online():
+        st.info("The log is read from Firestore. Reconnect to browse and correct entries.")
+        return
+
+    # --- Filters ---
+    f_col1, f_col2 = st.columns(2)
+    with f_col1:
+        type_label = st.selectbox("Type", list(TYPE_FILTERS), key="hist_type", on_change=reset_pages)
+    log_type = TYPE_FILTERS[type_label]
+    activity = None
+    if log_type == 'exercise':
+        with f_col2:
+            activity_label = st.selectbox("Exercise Type", ["All", *ACTIVITIES], key="hist_activity", on_change=reset_pages)
+        activity = None if activity_label == "All" else activity_label
+
+    # --- Page ---
+    try:
+        rows, next_cursor = load_page(log_type, activity)
+    except Exception as e:
+        report_db_error(e)
+        return
+
+    page_number = len(st.session_state['hist_cursors'])
+    if not rows:
+        st.info("No entries logged yet." if page_number == 1 else "No more entries.")
+
+    for row in rows:
+        when = local_datetime(row['ts_ms'], row['tz_offset_min'])
+        c1, c2, c3, c4 = st.columns([2, 4, 1, 1])
+        with c1:
+            st.markdown(f"**{when:%d %b %Y}** · {when:%H:%M}")
+        with c2:
+            st.markdown(f"{TYPE_ICONS.get(row['type'], '')} {describe(row)}")
+        with c3:
+            if st.button("✏️", key=f"hist_edit_btn_{row['id']}", help="Edit", use_container_width=True):
+                st.session_state['hist_editing'] = row['id']
+                st.session_state.pop('hist_confirm_delete', None)
+                st.rerun()
+        with c4:
+            if st.button("🗑", key=f"hist_del_btn_{row['id']}", help="Delete", use_container_width=True):
+                st.session_state['hist_confirm_delete'] = row['id']
+                st.session_state.pop('hist_editing', None)
+                st.rerun()
+
+        if st.session_state.get('hist_editing') == row['id']:
+            edit_form(row)
+        elif st.session_state.get('hist_confirm_delete') == row['id']:
+            confirm_delete(row)
+
+    # --- Pagination ---
+    st.markdown("---")
+    p_col1, p_col2, p_col3 = st.columns([1, 2, 1])
+    with p_col1:
+        if page_number > 1 and st.button("⬅ Newer", use_container_width=True):
+            st.session_state['hist_cursors'].pop()
+            st.session_state.pop('hist_rows', None)
+            st.rerun()
+    with p_col2:
+        st.caption(f"Page {page_number} · {HISTORY_PAGE_SIZE} entries per page")
+    with p_col3:
+        if next_cursor is not None and st.button("Older ➡", use_container_width=True):
+            st.session_state['hist_cursors'].append(next_cursor)
+            st.session_state.pop('hist_rows', None)
+            st.rerun()
@@ -2,19 +2,27 @@ import streamlit as st
 import time
 import base64
 import datetime
+import json
+import os
 import streamlit.components.v1 as components
 from utils import save_meditation_session
+from outbox import save_button
 
 # --- CONFIGURATION ---
 PHASES = [
     {"name": "intro", "label": "Introduction", "duration": 15, "audio": "01_intro.m4a"},
-    {"name": "breathing", "label": "Deep Breathing (3 Min)", "duration": 180, "audio": None}, # Gong only
+    {"name": "breathing", "label": "Deep Breathing (3 Min)", "duration": 180, "audio": None, "breath": True}, # Gong + breath cues
     {"name": "feet", "label": "Body Scan: Feet", "duration": 60, "audio": "05_body_piedi.m4a"},
     {"name": "torso", "label": "Body Scan: Torso", "duration": 60, "audio": "06_body_tronco.m4a"},
     {"name": "shoulders", "label": "Body Scan: Shoulders", "duration": 60, "audio": "07_body_spalle.m4a"},
     {"name": "closing", "label": "Closing", "duration": 20, "audio": "08_chiusura.m4a"}
 ]
 
+# Breath pacing for the breathing phase (sprite player only): clip and the seconds its slot lasts
+BREATH_CYCLE = [("02_inspira", 4), ("03_attendi", 4), ("04_espira", 6)]
+
+SPRITE_MANIFEST = "assets/audio/sprite.json" # Built by build_audio_sprite.py
+
 def load_audio_b64(file_path: str):
     try:
         with open(file_path, "rb") as f:
@@ -58,6 +66,152 @@ def inject_persistent_audio(b64_string, mime_type="audio/mp4", loop=False, eleme
 def get_audio_path(filename):
     return f"assets/audio/{filename}"
 
+@st.cache_data
+def load_sprite():
+    """(b64, manifest) of the built audio sprite, or None if it hasn't been built."""
+    try:
+        with open(SPRITE_MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    b64_string = load_audio_b64(get_audio_path(manifest["file"]))
+    return (b64_string, manifest) if b64_string else None
+
+def inject_sprite_player(b64_string, manifest):
+    """
+    Hosts the whole session's audio: the sprite is fetched and decoded once, and
+    every clip, the looping gong and the breath cues are scheduled from that one buffer.
+    The decoded buffer is kept on the parent window, so it outlives iframe remounts;
+    the HTML never changes during a session, so reruns don't reload the iframe.
+    Phases are started by cue_phase().
+    """
+    html_content = f"""
+        <html>
+        <body>
+        <script>
+        const P = window.parent;
+        const MANIFEST = {json.dumps(manifest)};
+        const BREATH = {json.dumps(BREATH_CYCLE)};
+
+        function makePlayer(ctx, buffer) {{
+            const player = {{ voices: [], gong: null, phaseKey: null }};
+            const clip = (name) => MANIFEST.clips[name];
+
+            player.playClip = (name, when) => {{
+                const c = clip(name);
+                if (!c) return;
+                const src = ctx.createBufferSource();
+                src.buffer = buffer;
+                src.connect(ctx.destination);
+                src.start(when, c.start, c.end - c.start);
+                player.voices.push(src);
+            }};
+
+            player.stopVoices = () => {{
+                player.voices.forEach(v => {{ try {{ v.stop(); }} catch (e) {{}} }});
+                player.voices = [];
+            }};
+
+            player.startGong = () => {{
+                const c = clip('gong');
+                if (!c || player.gong) return;
+                const src = ctx.createBufferSource();
+                src.buffer = buffer;
+                src.loop = true;
+                src.loopStart = c.start;
+                src.loopEnd = c.end;
+                src.connect(ctx.destination);
+                src.start(0, c.start);
+                player.gong = src;
+            }};
+
+            player.cue = (cue) => {{
+                // Same phase: the cue iframe was only remounted
+                if (cue.key === player.phaseKey) return;
+                player.phaseKey = cue.key;
+                if (ctx.state === 'suspended') ctx.resume();
+                player.startGong();
+                player.stopVoices();
+
+                const t0 = ctx.currentTime + 0.05;
+                if (cue.clip) player.playClip(cue.clip, t0);
+                if (cue.breath) {{
+                    // Inhale / hold / exhale back to back until the phase ends
+                    const slots = BREATH.filter(([name]) => clip(name))
+                        .map(([name, seconds]) => [name, Math.max(seconds, clip(name).end - clip(name).start)]);
+                    if (!slots.length) return;
+                    let t = t0;
+                    while (t < t0 + cue.duration) {{
+                        for (const [name, slot] of slots) {{
+                            if (t >= t0 + cue.duration) break;
+                            player.playClip(name, t);
+                            t += slot;
+                        }}
+                    }}
+                }}
+            }};
+
+            player.stop = () => {{
+                player.stopVoices();
+                if (player.gong) {{
+                    try {{ player.gong.stop(); }} catch (e) {{}}
+                    player.gong = null;
+                }}
+                player.phaseKey = null;
+            }};
+            return player;
+        }}
+
+        async function init() {{
+            let cached = P.__anchorAudioBuffer;
+            if (!cached || cached.version !== MANIFEST.version) {{
+                // Created in the parent realm so playback isn't tied to this iframe
+                const ctx = new (P.AudioContext || P.webkitAudioContext)();
+                const bytes = Uint8Array.from(atob("{b64_string}"), ch => ch.charCodeAt(0));
+                const buffer = await ctx.decodeAudioData(bytes.buffer);
+                cached = P.__anchorAudioBuffer = {{ version: MANIFEST.version, ctx, buffer }};
+            }}
+            P.__anchorAudio = makePlayer(cached.ctx, cached.buffer);
+            if (P.__anchorPendingCue) {{
+                P.__anchorAudio.cue(P.__anchorPendingCue);
+                P.__anchorPendingCue = null;
+            }}
+        }}
+
+        init().catch(e => console.log("Audio sprite failed:", e));
+
+        // Leaving the running screen removes this iframe: silence the session
+        window.addEventListener('pagehide', () => {{
+            if (P.__anchorAudio) P.__anchorAudio.stop();
+            P.__anchorAudio = null;
+        }});
+        </script>
+        </body>
+        </html>
+    """
+    components.html(html_content, height=0)
+
+def cue_phase(phase_key, phase):
+    """Starts a phase on the sprite player; the HTML only changes when the phase does."""
+    cue = {
+        "key": phase_key,
+        "clip": os.path.splitext(phase["audio"])[0] if phase["audio"] else None,
+        "breath": phase.get("breath", False),
+        "duration": phase["duration"],
+    }
+    components.html(f"""
+        <script>
+        const P = window.parent;
+        const cue = {json.dumps(cue)};
+        if (P.__anchorAudio) {{
+            P.__anchorAudio.cue(cue);
+        }} else {{
+            // Player still decoding: it picks this up when ready
+            P.__anchorPendingCue = cue;
+        }}
+        </script>
+    """, height=0)
+
 def show():
     st.header("Deep Focus Operations")
 
@@ -84,24 +238,32 @@ def show():
                 
         with tab_manual:
             st.markdown("### Manual Meditation Entry")
-            with st.form("manual_med_form"):
-                log_date = st.date_input("Date of Session", value=datetime.date.today())
-                log_minutes = st.number_input("Duration (Minutes)", min_value=1, value=15)
-                
-                if st.form_submit_button("💾 SAVE ENTRY", use_container_width=True):
-                    # Convert Date to Datetime
-                    dt_log = datetime.datetime.combine(log_date, datetime.time(12, 0))
-                    if save_meditation_session(log_minutes, custom_date=dt_log):
-                        st.success(f"Meditation log saved for {log_date}")
-                        time.sleep(1)
-                        st.rerun()
+            # No form: the save button queues the entry on the device, with the values on screen
+            log_date = st.date_input("Date of Session", value=datetime.date.today())
+            log_minutes = st.number_input("Duration (Minutes)", min_value=1, value=15)
+
+            # Convert Date to Datetime
+            dt_log = datetime.datetime.combine(log_date, datetime.time(12, 0))
+            if save_button("💾 SAVE ENTRY", {
+                "type": "meditation",
+                "duration_minutes": log_minutes,
+                "completed_at": dt_log,
+            }, key="med_manual_save"):
+                st.success(f"Meditation log saved for {log_date}")
+                time.sleep(1)
+                st.rerun()
         return
 
     # --- RUNNING SCREEN ---
     
-    # 1. Background Gong (Persistent Component)
-    gong_b64 = load_audio_b64(get_audio_path("Gong Semplice.mp3"))
-    inject_persistent_audio(gong_b64, mime_type="audio/mp3", loop=True, element_id="bg_gong")
+    # 1. Audio: one sprite for the whole session, or per-clip players if it hasn't been built
+    sprite = load_sprite()
+    if sprite:
+        inject_sprite_player(*sprite)
+    else:
+        # Background Gong (Persistent Component)
+        gong_b64 = load_audio_b64(get_audio_path("Gong Semplice.mp3"))
+        inject_persistent_audio(gong_b64, mime_type="audio/mp3", loop=True, element_id="bg_gong")
 
     # 2. Timer & Phase Logic
     idx = st.session_state['current_phase_index']
@@ -118,7 +280,9 @@ def show():
     current_phase = PHASES[idx]
 
     # 3. Voice Audio (Persistent for Phase duration)
-    if current_phase["audio"]:
+    if sprite:
+        cue_phase(f"{idx}-{st.session_state['phase_start_time']}", current_phase)
+    elif current_phase["audio"]:
         audio_b64 = load_audio_b64(get_audio_path(current_phase["audio"]))
         inject_persistent_audio(audio_b64, mime_type="audio/mp4", loop=False, element_id=f"voice_{current_phase['name']}")
     else:
@@ -0,0 +1,259 @@
+"""
+KPI and grouping logic shared by the Dashboard and the offline report generator.
+Pure pandas/NumPy: no Streamlit, no Firestore, safe in worker threads and processes.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+TREND_KINDS = ("meditation", "exercise")
+ROLLING_WINDOWS = (7, 30)
+
+
+def prepare_logs(raw_logs):
+    """
+    Builds the log DataFrame with a naive local 'datetime' column.
+    Canonical rows carry epoch ms, so this is integer math, not parsing.
+    """
+    df = pd.DataFrame(raw_logs)
+
+    if not df.empty:
+        local_ms = df['ts_ms'].astype('int64') + df['tz_offset_min'].astype('int64') * 60_000
+        df['datetime'] = pd.to_datetime(local_ms, unit='ms')
+
+    return df
+
+
+def split_by_type(df):
+    """Returns (meditation_df, exercise_df, weight_df)."""
+    if df.empty:
+        return df, df, df
+    return (
+        df[df['type'] == 'meditation'].copy(),
+        df[df['type'] == 'exercise'].copy(),
+        df[df['type'] == 'weight'].copy(),
+    )
+
+
+def compute_kpis(weight_df, exercise_df, meditation_df):
+    """Totals behind the KPI tiles: latest weight, calories, exercise and meditation minutes."""
+    kpis = {'weight': 0, 'calories': 0, 'exercise_minutes': 0, 'meditation_minutes': 0}
+    if not weight_df.empty:
+        kpis['weight'] = weight_df.sort_values('datetime', ascending=False).iloc[0]['weight']
+    if not exercise_df.empty:
+        kpis['calories'] = exercise_df['calories'].sum()
+        kpis['exercise_minutes'] = exercise_df['duration_minutes'].sum()
+    if not meditation_df.empty:
+        kpis['meditation_minutes'] = meditation_df['duration_minutes'].sum()
+    return kpis
+
+
+def per_day(total, days):
+    return int(total / max(1, days))
+
+
+def daily_totals(df, column):
+    """Sum of `column` per local calendar day, as a DataFrame with 'datetime' (date) and `column`."""
+    return df.groupby(df['datetime'].dt.date)[column].sum().reset_index()
+
+
+def activity_breakdown(exercise_df):
+    """Minutes, calories and session count per exercise activity, most minutes first."""
+    if exercise_df.empty:
+        return pd.DataFrame(columns=['activity', 'duration_minutes', 'calories', 'sessions'])
+    breakdown = exercise_df.groupby('activity').agg(
+        duration_minutes=('duration_minutes', 'sum'),
+        calories=('calories', 'sum'),
+        sessions=('activity', 'size'),
+    ).reset_index()
+    return breakdown.sort_values('duration_minutes', ascending=False)
+
+
+def weight_change(weight_df):
+    """(first, last, delta) weight over the frame, or None if no weight was logged."""
+    if weight_df.empty:
+        return None
+    ordered = weight_df.sort_values('datetime')
+    first, last = ordered.iloc[0]['weight'], ordered.iloc[-1]['weight']
+    return first, last, round(last - first, 1)
+
+
+# --- Trends ---
+
+def day_offsets(df, first_day):
+    """Local calendar day of each row, as whole days since first_day."""
+    return (df['datetime'].dt.normalize() - pd.Timestamp(first_day)).dt.days.to_numpy()
+
+
+def dense_daily(df, column, first_day, n_days):
+    """Per-day sums of `column` for n_days from first_day, zero on days without rows."""
+    if df.empty or n_days <= 0:
+        return np.zeros(max(0, n_days))
+    offsets = day_offsets(df, first_day)
+    keep = (offsets >= 0) & (offsets < n_days)
+    values = df[column].to_numpy(dtype=float)
+    return np.bincount(offsets[keep], weights=values[keep], minlength=n_days)
+
+
+def streak_lengths(active, carry=0):
+    """
+    Length of the run of active days ending on each day, 0 on inactive days.
+    `carry` is the run ending the day before the first one.
+    """
+    active = np.asarray(active, dtype=bool)
+    index = np.arange(len(active))
+    last_inactive = np.maximum.accumulate(np.where(active, -1, index)) if len(active) else index
+    runs = np.where(active, index - last_inactive, 0)
+    return np.where(active & (last_inactive < 0), runs + carry, runs)
+
+
+def weight_terms(weight_df, first_day, n_days):
+    """Per-day least-squares terms (n, Σx, Σy, Σx², Σxy) of weight against day offset."""
+    terms = np.zeros((max(0, n_days), 5))
+    if weight_df.empty or n_days <= 0:
+        return terms
+    x = day_offsets(weight_df, first_day)
+    keep = (x >= 0) & (x < n_days)
+    x, y = x[keep], weight_df['weight'].to_numpy(dtype=float)[keep]
+    xf = x.astype(float)
+    for column, values in enumerate((np.ones_like(xf), xf, y, xf * xf, xf * y)):
+        terms[:, column] = np.bincount(x, weights=values, minlength=n_days)
+    return terms
+
+
+def fit_line(terms):
+    """(slope per day, intercept) from summed least-squares terms, or None under two points."""
+    n, sx, sy, sxx, sxy = terms
+    denominator = n * sxx - sx * sx
+    if n < 2 or denominator <= 0:
+        return None
+    slope = (n * sxy - sx * sy) / denominator
+    return slope, (sy - slope * sx) / n
+
+
+class TrendSeries:
+    """
+    Daily series of closed days (first_day .. last_day), built once and extended
+    in place as days close. Everything derived from a closed day is computed when
+    the day is appended, as prefix sums and running streaks, so a trailing window,
+    a streak or a weight fit over any range costs O(1) plus today's rows.
+    """
+
+    def __init__(self, first_day):
+        self.first_day = first_day
+        self.days = 0
+        # cumulative[k][i]: minutes of kind k on the days before day i
+        self.cumulative = {kind: np.zeros(1) for kind in TREND_KINDS}
+        self.streaks = {kind: np.zeros(0, dtype=np.int64) for kind in TREND_KINDS}
+        self.longest = {kind: 0 for kind in TREND_KINDS}
+        # weight_prefix[i]: weight least-squares terms of the days before day i
+        self.weight_prefix = np.zeros((1, 5))
+
+    @property
+    def last_day(self):
+        return self.first_day + datetime.timedelta(days=self.days - 1)
+
+    def extend(self, df, through_day):
+        """Appends the days after last_day through through_day, from the rows of those days."""
+        n_days = (through_day - self.last_day).days
+        if n_days <= 0:
+            return
+        start = self.last_day + datetime.timedelta(days=1)
+        meditation_df, exercise_df, weight_df = split_by_type(df)
+
+        for kind, rows in zip(TREND_KINDS, (meditation_df, exercise_df)):
+            daily = dense_daily(rows, 'duration_minutes', start, n_days)
+            cumulative = self.cumulative[kind]
+            self.cumulative[kind] = np.concatenate([cumulative, cumulative[-1] + np.cumsum(daily)])
+            carry = self.streaks[kind][-1] if self.days else 0
+            runs = streak_lengths(daily > 0, carry)
+            self.streaks[kind] = np.concatenate([self.streaks[kind], runs])
+            self.longest[kind] = max(self.longest[kind], int(runs.max()))
+
+        # Offsets stay relative to first_day so prefix terms add up across extensions
+        terms = weight_terms(weight_df, self.first_day, self.days + n_days)[self.days:]
+        self.weight_prefix = np.concatenate([self.weight_prefix, self.weight_prefix[-1] + np.cumsum(terms, axis=0)])
+        self.days += n_days
+
+    def truncate(self, day):
+        """
+        Drops `day` and the days after it, so extend() recomputes them from fresh rows.
+        Returns False when nothing before `day` would be left: build a new series instead.
+        """
+        keep = (day - self.first_day).days
+        if keep <= 0:
+            return False
+        if keep >= self.days:
+            return True
+        for kind in TREND_KINDS:
+            self.cumulative[kind] = self.cumulative[kind][:keep + 1]
+            self.streaks[kind] = self.streaks[kind][:keep]
+            self.longest[kind] = int(self.streaks[kind].max())
+        self.weight_prefix = self.weight_prefix[:keep + 1]
+        self.days = keep
+        return True
+
+    def _today(self, today_df, today):
+        """Minutes per kind and weight terms of today's (still open) rows."""
+        if not today_df.empty:
+            today_df = today_df[today_df['datetime'].dt.date == today]
+        meditation_df, exercise_df, weight_df = split_by_type(today_df)
+        minutes = {
+            kind: float(rows['duration_minutes'].sum()) if not rows.empty else 0.0
+            for kind, rows in zip(TREND_KINDS, (meditation_df, exercise_df))
+        }
+        return minutes, weight_terms(weight_df, self.first_day, self.days + 1)[self.days]
+
+    def summary(self, today_df, today, range_days=None):
+        """
+        Trend figures as of today: {'rolling', 'streaks', 'weight_rate', 'weight_fit', 'chart'}.
+        today_df holds today's rows (any range including today); range_days bounds the
+        weight fit and the chart, None for all history.
+        """
+        minutes, today_terms = self._today(today_df, today)
+        total_days = self.days + 1
+        window = total_days if range_days is None else min(range_days, total_days)
+
+        rolling, streaks = {}, {}
+        for kind in TREND_KINDS:
+            cumulative = self.cumulative[kind]
+            rolling[kind] = {}
+            for days in ROLLING_WINDOWS:
+                span = min(days, total_days)
+                rolling[kind][days] = (cumulative[-1] - cumulative[total_days - span] + minutes[kind]) / span
+            # Today still counts toward a streak until it is over
+            previous = int(self.streaks[kind][-1]) if self.days else 0
+            current = previous + 1 if minutes[kind] > 0 else previous
+            streaks[kind] = {'current': current, 'longest': max(self.longest[kind], current)}
+
+        terms = self.weight_prefix[-1] - self.weight_prefix[total_days - window] + today_terms
+        fit = fit_line(terms)
+        weight_fit = None
+        if fit is not None:
+            slope, intercept = fit
+            x = np.array([total_days - window, total_days - 1])
+            weight_fit = pd.DataFrame({
+                'datetime': pd.Timestamp(self.first_day) + pd.to_timedelta(x, unit='D'),
+                'weight': intercept + slope * x,
+            })
+
+        return {
+            'rolling': rolling,
+            'streaks': streaks,
+            'weight_rate': None if fit is None else round(fit[0] * 7, 2),
+            'weight_fit': weight_fit,
+            'chart': self._rolling_chart(minutes, window),
+        }
+
+    def _rolling_chart(self, today_minutes, window):
+        """Trailing averages for each of the last `window` days, one column per kind and window."""
+        total_days = self.days + 1
+        ends = np.arange(total_days - window, total_days) + 1
+        chart = pd.DataFrame({'datetime': pd.Timestamp(self.first_day) + pd.to_timedelta(ends - 1, unit='D')})
+        for kind in TREND_KINDS:
+            cumulative = np.append(self.cumulative[kind], self.cumulative[kind][-1] + today_minutes[kind])
+            for days in ROLLING_WINDOWS:
+                starts = np.maximum(0, ends - days)
+                chart[f"{kind}_{days}d"] = (cumulative[ends] - cumulative[starts]) / (ends - starts)
+        return chart
@@ -0,0 +1,103 @@
+"""
+Browser-side durable outbox for log entries (frontend: assets/session_manager).
+
+Save buttons rendered with save_button() put the entry in the browser's IndexedDB
+before anything crosses the websocket, so a click made while the socket is down
+is kept on the device. The hidden session manager, which also holds the screen
+wake lock, sends everything still queued as one batch once the page is back
+online. The server writes it with utils.save_logs_batch, which dedupes on the
+client-generated id, and acknowledges the stored ids on the next render so the
+browser can drop them.
+
+The entry stored on the click run is built from that run's widget values; the
+browser contributes only its id and the click time. Its own copy, rendered with
+the previous run's values, is the fallback for clicks that never reached the
+server, and is replaced by the server's copy if it is flushed later.
+
+Server-computed fields (e.g. a sensor summary) never go through the browser: the
+entry carries a reference to them and they are added when the entry is stored.
+"""
+import hashlib
+import json
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from schema import to_canonical
+from utils import save_logs_batch
+
+COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "session_manager")
+ACK_HISTORY = 200
+ATTACHMENT_HISTORY = 20
+
+_component = components.declare_component("session_manager", path=COMPONENT_DIR)
+
+
+def _sync(entries):
+    # Clicks this session handled are stored with the values the server saw at the click
+    fresh = st.session_state.get('outbox_fresh', {})
+    entries = [fresh.get(entry.get('id'), entry) for entry in entries]
+    kept = st.session_state.get('outbox_attachments', {})
+    attachments = {entry.get('id'): kept[entry['attach_ref']] for entry in entries if entry.get('attach_ref') in kept}
+    stored = save_logs_batch(entries, attachments)
+    acked = st.session_state.get('outbox_acked', []) + stored
+    st.session_state['outbox_acked'] = acked[-ACK_HISTORY:]
+    return stored
+
+
+def session_manager(sync):
+    """
+    Hidden manager, rendered once per run. `sync` enables flushing, so entries
+    queued before a login wait for an authenticated session.
+    """
+    batch = _component(mode="manager", sync=sync, acked=st.session_state.get('outbox_acked', []),
+                       key="session_manager", default=None)
+    # The component keeps returning its last batch until it sends a new one
+    if not sync or not batch or batch['batch_id'] == st.session_state.get('outbox_batch_id'):
+        return
+    st.session_state['outbox_batch_id'] = batch['batch_id']
+    if _sync(batch['entries']):
+        # Hand the acknowledgement to the manager now, not on the next interaction
+        st.rerun()
+
+
+def _keep_attachment(attach):
+    """Keeps server-side fields for the session; the reference is stable across reruns."""
+    ref = hashlib.sha1(json.dumps(attach, sort_keys=True).encode()).hexdigest()
+    kept = st.session_state.setdefault('outbox_attachments', {})
+    kept[ref] = attach
+    for old in list(kept)[:-ATTACHMENT_HISTORY]:
+        del kept[old]
+    return ref
+
+
+def save_button(label, entry, key, attach=None):
+    """
+    Outbox-backed save button. `entry` is a log without event time, stamped in the
+    browser at the click, or with 'completed_at' (manual entries), canonicalized here.
+    Build it from the current widget values: on the click run it is what gets stored.
+    `attach` holds fields computed on the server, stored with the entry but never
+    sent to the browser.
+    Returns True on the run that receives the click; the entry is already stored,
+    or kept on the device until it can be.
+    """
+    if 'completed_at' in entry:
+        entry = to_canonical(entry)
+    if attach:
+        entry = {**entry, 'attach_ref': _keep_attachment(attach)}
+    handled = st.session_state.setdefault('outbox_handled', [])
+    # Handled ids re-enable the button; callers rerun after a save, so the next render carries it
+    clicked = _component(mode="save", label=label, entry=entry, handled=handled, key=key, default=None)
+    if not clicked or clicked['id'] in handled:
+        return False
+    handled.append(clicked['id'])
+    st.session_state['outbox_handled'] = handled[-ACK_HISTORY:]
+    # Values from this run, not from the render the browser clicked on; id and click time from the browser
+    entry = {**clicked, **entry}
+    fresh = st.session_state.setdefault('outbox_fresh', {})
+    fresh[clicked['id']] = entry
+    for doc_id in list(fresh)[:-ACK_HISTORY]:
+        del fresh[doc_id]
+    _sync([entry])
+    return True
@@ -0,0 +1,171 @@
+"""
+On-demand sampling profiler for script reruns.
+
+While armed from the sidebar (operators only, ANCHOR_OPERATOR=1), each of the next N
+runs of main.main is sampled from a helper thread and written to PROFILE_DIR as:
+- <stem>.speedscope.json  open at https://www.speedscope.app
+- <stem>.collapsed.txt    folded stacks for flamegraph.pl / speedscope
+The file stem carries the page and filter state of the run. Unarmed runs call main
+directly: no thread, no hooks.
+"""
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import streamlit as st
+
+OPERATOR_TOOLS = os.environ.get("ANCHOR_OPERATOR") == "1"
+PROFILE_DIR = os.environ.get("ANCHOR_PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = 0.001  # seconds
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []  # (stack root-first, weight in seconds)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rerun-profiler", daemon=True)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((tuple(stack), now - last))
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+
+def _frame_label(frame):
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def write_collapsed(samples, path):
+    """Folded stacks, one 'a;b;c <microseconds>' line per distinct stack."""
+    folded = {}
+    for stack, weight in samples:
+        key = ";".join(_frame_label(frame) for frame in stack)
+        folded[key] = folded.get(key, 0) + weight
+    with open(path, "w") as f:
+        for key, weight in sorted(folded.items()):
+            f.write(f"{key} {max(1, round(weight * 1e6))}\n")
+
+
+def write_speedscope(samples, elapsed, name, path):
+    frames, index = [], {}
+    encoded = []
+    for stack, _ in samples:
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            ids.append(index[frame])
+        encoded.append(ids)
+
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "the-anchor-profiler",
+        "name": name,
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": elapsed,
+            "samples": encoded,
+            "weights": [weight for _, weight in samples],
+        }],
+    }
+    with open(path, "w") as f:
+        json.dump(document, f)
+
+
+def run_tag():
+    """Page and filter state of the current run, e.g. 'Dashboard range=7 Days activity=All'."""
+    page = st.session_state.get("nav_page", "Dashboard")
+    parts = [page]
+    if page == "Dashboard":
+        parts.append(f"range={st.session_state.get('dash_range', '7 Days')}")
+        parts.append(f"activity={st.session_state.get('dash_activity', 'All')}")
+    elif page == "Meditation":
+        parts.append(f"state={st.session_state.get('med_state', 'idle')}")
+        parts.append(f"phase={st.session_state.get('current_phase_index', 0)}")
+    elif page == "Exercise":
+        parts.append(f"activity={st.session_state.get('ex_activity')}")
+        parts.append(f"timer={'on' if st.session_state.get('ex_start_time') else 'off'}")
+    elif page == "History":
+        parts.append(f"type={st.session_state.get('hist_type', 'All')}")
+        parts.append(f"page={len(st.session_state.get('hist_cursors', [None]))}")
+    return " ".join(parts)
+
+
+def profile_run(fn):
+    """Runs fn under the sampler and writes its profile, even when fn ends in st.rerun()."""
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    try:
+        fn()
+    finally:
+        sampler.stop()
+        st.session_state["profile_runs_left"] -= 1
+
+        tag = run_tag()
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        stem = os.path.join(PROFILE_DIR, f"{stamp}_{re.sub(r'[^A-Za-z0-9=]+', '-', tag)}")
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        write_speedscope(sampler.samples, sampler.elapsed, tag, stem + ".speedscope.json")
+        write_collapsed(sampler.samples, stem + ".collapsed.txt")
+
+
+def run(fn):
+    """Entry point wrapper: profiles fn only while runs are armed."""
+    if st.session_state.get("profile_runs_left"):
+        profile_run(fn)
+    else:
+        fn()
+
+
+def on_toggle():
+    """Sidebar toggle callback: arms the next N runs, or cancels the capture."""
+    if st.session_state["profile_toggle"]:
+        st.session_state["profile_runs_left"] = st.session_state["profile_n"]
+    else:
+        st.session_state["profile_runs_left"] = 0
+
+
+def sidebar_controls():
+    st.markdown("---")
+    # A finished capture flips the toggle back; allowed only before the widget renders
+    if st.session_state.get("profile_toggle") and not st.session_state.get("profile_runs_left"):
+        st.session_state["profile_toggle"] = False
+    st.number_input("Reruns to profile", min_value=1, max_value=100, value=5, key="profile_n")
+    st.toggle("🔬 Profile reruns", key="profile_toggle", on_change=on_toggle)
+    if st.session_state.get("profile_runs_left"):
+        st.caption(f"{st.session_state['profile_runs_left']} runs left → {PROFILE_DIR}/")
@@ -0,0 +1,231 @@
+"""
+Offline weekly reports, without the Streamlit UI.
+
+    python report.py --firestore --weeks 4
+    python report.py --input .anchor_snapshot --input exports/alice.jsonl --start 2025-01-06 --end 2025-06-30
+
+Each input (Firestore, a snapshot directory or an exported file of canonical rows)
+is reported separately, one report per input per Monday-start week. Reports are
+built in a process pool, one task per (input, week), and written as JSON and HTML
+to --out along with an index.json.
+
+Supported exports: snapshot directories (see snapshot.py), .jsonl, .json, .parquet,
+.arrow/.feather.
+"""
+import argparse
+import datetime
+import functools
+import html
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from archive import drop_folded, expand_all, latest_live
+from modules.metrics import (
+    prepare_logs, split_by_type, compute_kpis, per_day, activity_breakdown, weight_change
+)
+
+
+def _read_snapshot_dir(path):
+    frames = []
+    base = os.path.join(path, "logs.arrow")
+    if os.path.exists(base):
+        import pyarrow.feather as feather
+        # Memory-mapped: every worker reading the same snapshot shares its pages
+        frames.append(feather.read_table(base, memory_map=True).to_pandas())
+    delta = os.path.join(path, "delta.jsonl")
+    if os.path.exists(delta) and os.path.getsize(delta):
+        frames.append(pd.read_json(delta, lines=True))
+    history = latest_live(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
+
+    archives_file = os.path.join(path, "archives.json")
+    if os.path.exists(archives_file):
+        with open(archives_file) as f:
+            archives = json.load(f)
+        history = drop_folded(history, archives)
+        history = pd.concat([history, pd.DataFrame(expand_all(archives.values()))], ignore_index=True)
+    return history
+
+
+@functools.lru_cache(maxsize=None)
+def load_input(path):
+    """Canonical rows of one export as a prepared DataFrame; loaded once per worker process."""
+    if os.path.isdir(path):
+        raw = _read_snapshot_dir(path)
+    elif path.endswith(".jsonl"):
+        raw = pd.read_json(path, lines=True)
+    elif path.endswith(".json"):
+        with open(path) as f:
+            raw = pd.DataFrame(json.load(f))
+    elif path.endswith(".parquet"):
+        raw = pd.read_parquet(path)
+    elif path.endswith((".arrow", ".feather")):
+        raw = pd.read_feather(path)
+    else:
+        raise ValueError(f"Unsupported input: {path}")
+    return prepare_logs(raw)
+
+
+def weeks_between(start, end):
+    """Monday-start weeks overlapping [start, end], as (start, end) datetimes, end exclusive."""
+    monday = start - datetime.timedelta(days=start.weekday())
+    weeks = []
+    while monday <= end:
+        week_start = datetime.datetime.combine(monday, datetime.time())
+        weeks.append((week_start, week_start + datetime.timedelta(days=7)))
+        monday += datetime.timedelta(days=7)
+    return weeks
+
+
+def last_weeks(count):
+    """The last `count` complete weeks."""
+    this_monday = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
+    return weeks_between(this_monday - datetime.timedelta(weeks=count), this_monday - datetime.timedelta(days=1))
+
+
+def summarize(df, start, end):
+    if not df.empty:
+        df = df[(df['datetime'] >= start) & (df['datetime'] < end)]
+    meditation_df, exercise_df, weight_df = split_by_type(df)
+    kpis = compute_kpis(weight_df, exercise_df, meditation_df)
+    days = (end - start).days
+    change = weight_change(weight_df)
+
+    return {
+        "period": {"start": start.date().isoformat(), "end": (end - datetime.timedelta(days=1)).date().isoformat()},
+        "totals": {
+            "meditation_minutes": int(kpis['meditation_minutes']),
+            "exercise_minutes": int(kpis['exercise_minutes']),
+            "calories": int(kpis['calories']),
+            "meditation_sessions": len(meditation_df),
+            "exercise_sessions": len(exercise_df),
+        },
+        "averages_per_day": {
+            "meditation_minutes": per_day(kpis['meditation_minutes'], days),
+            "exercise_minutes": per_day(kpis['exercise_minutes'], days),
+            "calories": per_day(kpis['calories'], days),
+        },
+        "activities": [
+            {
+                "activity": row.activity,
+                "minutes": int(row.duration_minutes),
+                "calories": int(row.calories),
+                "sessions": int(row.sessions),
+            }
+            for row in activity_breakdown(exercise_df).itertuples()
+        ],
+        "weight": None if change is None else {
+            "first": float(change[0]), "last": float(change[1]), "delta": float(change[2]),
+        },
+    }
+
+
+def render_html(label, report):
+    totals, averages = report["totals"], report["averages_per_day"]
+    rows = "".join(
+        f"<tr><td>{html.escape(a['activity'])}</td><td>{a['minutes']}</td><td>{a['calories']}</td><td>{a['sessions']}</td></tr>"
+        for a in report["activities"]
+    ) or "<tr><td colspan='4'>No exercise logged.</td></tr>"
+    weight = report["weight"]
+    weight_line = (
+        f"{weight['first']} → {weight['last']} kg ({weight['delta']:+} kg)" if weight else "No weight logged."
+    )
+    period = report["period"]
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>The Anchor · {html.escape(label)} · {period['start']}</title>
+<style>
+body {{ font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; background: #0e1117; color: #c9d1d9; margin: 40px; }}
+table {{ border-collapse: collapse; margin-bottom: 24px; }}
+td, th {{ border: 1px solid #30363d; padding: 6px 12px; text-align: left; }}
+h1, h2 {{ color: white; }}
+</style></head><body>
+<h1>⚓ Weekly Report · {html.escape(label)}</h1>
+<p>{period['start']} – {period['end']}</p>
+<h2>Totals</h2>
+<table>
+<tr><th></th><th>Total</th><th>Avg / Day</th></tr>
+<tr><td>Meditation (min)</td><td>{totals['meditation_minutes']}</td><td>{averages['meditation_minutes']}</td></tr>
+<tr><td>Exercise (min)</td><td>{totals['exercise_minutes']}</td><td>{averages['exercise_minutes']}</td></tr>
+<tr><td>Calories (kcal)</td><td>{totals['calories']}</td><td>{averages['calories']}</td></tr>
+</table>
+<h2>Exercise Breakdown</h2>
+<table><tr><th>Activity</th><th>Minutes</th><th>Kcal</th><th>Sessions</th></tr>{rows}</table>
+<h2>Weight</h2>
+<p>{weight_line}</p>
+</body></html>
+"""
+
+
+def build_report(label, source, start, end, out_dir):
+    """
+    One (input, week) task. `source` is a path, loaded and cached per process,
+    or a list of canonical rows already sliced to the week.
+    """
+    df = load_input(source) if isinstance(source, str) else prepare_logs(source)
+    report = summarize(df, start, end)
+    report["input"] = label
+
+    stem = os.path.join(out_dir, f"{label}_{report['period']['start']}")
+    with open(stem + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(stem + ".html", "w") as f:
+        f.write(render_html(label, report))
+    return report
+
+
+def _firestore_rows(start, end):
+    # Imported here so worker processes never initialize Streamlit or Firebase
+    from utils import fetch_remote_logs, db
+    if db is None:
+        raise SystemExit("Firestore is not configured.")
+    return fetch_remote_logs(start_date=start, end_date=end)
+
+
+def _label(path):
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate weekly reports from Firestore or exported snapshots.")
+    parser.add_argument("--firestore", action="store_true", help="Report on the live daily_logs collection")
+    parser.add_argument("--input", action="append", default=[], help="Snapshot directory or export file (repeatable)")
+    parser.add_argument("--weeks", type=int, default=1, help="Last N complete weeks (ignored with --start)")
+    parser.add_argument("--start", type=datetime.date.fromisoformat)
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if not args.firestore and not args.input:
+        parser.error("give --firestore and/or at least one --input")
+
+    weeks = weeks_between(args.start, args.end) if args.start else last_weeks(args.weeks)
+    os.makedirs(args.out, exist_ok=True)
+
+    tasks = []
+    if args.firestore:
+        rows = _firestore_rows(weeks[0][0], weeks[-1][1])
+        df = prepare_logs(rows)
+        for start, end in weeks:
+            week_rows = [row for row, when in zip(rows, df.get('datetime', [])) if start <= when < end]
+            tasks.append(("firestore", week_rows, start, end))
+    for path in args.input:
+        for start, end in weeks:
+            tasks.append((_label(path), path, start, end))
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(build_report, label, source, start, end, args.out) for label, source, start, end in tasks]
+        reports = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    with open(os.path.join(args.out, "index.json"), "w") as f:
+        json.dump([{"input": r["input"], **r["period"], **r["totals"]} for r in reports], f, indent=2)
+    print(f"Wrote {len(reports)} reports to {args.out}/ in {elapsed:.2f}s with {args.workers} workers.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import datetime
+
+# --- Canonical Log Schema ---
+# Every entry in daily_logs is written in this shape:
+#   schema_version  int    SCHEMA_VERSION
+#   type            str    "meditation" | "exercise" | "weight"
+#   ts_ms           int    event time, UTC epoch milliseconds
+#   tz_offset_min   int    local UTC offset at event time, in minutes
+#   date_str        str    local day, "YYYY-MM-DD"
+#   activity        str    exercise only
+#   duration_minutes, calories, weight   typed numerics (see NUMERIC_FIELDS)
+#   timestamp       server write time (Firestore only)
+SCHEMA_VERSION = 2
+
+NUMERIC_FIELDS = {
+    "duration_minutes": int,
+    "calories": int,
+    "weight": float,
+}
+
+# Legacy time fields folded into ts_ms / tz_offset_min
+LEGACY_FIELDS = ("completed_at", "datetime")
+
+
+def to_epoch_ms(dt):
+    """Naive datetimes are taken as local wall time."""
+    return int(dt.astimezone().timestamp() * 1000)
+
+
+def local_datetime(ts_ms, tz_offset_min):
+    """Naive local wall time of a canonical event."""
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(milliseconds=ts_ms + tz_offset_min * 60_000)
+
+
+def _event_time(data):
+    """
+    Resolves the event time of a (possibly legacy) entry as an aware datetime.
+    completed_at holds local wall time; Firestore hands legacy values back
+    labelled UTC, so the label is dropped before localizing.
+    """
+    completed_at = data.get("completed_at")
+    if completed_at:
+        return completed_at.replace(tzinfo=None).astimezone()
+    timestamp = data.get("timestamp")
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.astimezone()
+    if data.get("date_str"):
+        return datetime.datetime.strptime(data["date_str"], "%Y-%m-%d").replace(hour=12).astimezone()
+    return datetime.datetime.now().astimezone()
+
+
+def is_canonical(data):
+    return data.get("schema_version") == SCHEMA_VERSION
+
+
+def to_canonical(data):
+    """
+    Returns the canonical form of a log entry. Canonical input is returned as is;
+    legacy entries get epoch time, typed numerics and the version tag.
+    Unknown fields are kept.
+    """
+    if is_canonical(data):
+        return data
+
+    event_time = _event_time(data)
+    record = {k: v for k, v in data.items() if k not in LEGACY_FIELDS}
+    record["schema_version"] = SCHEMA_VERSION
+    record["ts_ms"] = int(event_time.timestamp() * 1000)
+    record["tz_offset_min"] = int(event_time.utcoffset().total_seconds() // 60)
+    record["date_str"] = event_time.strftime("%Y-%m-%d")
+
+    for field, cast in NUMERIC_FIELDS.items():
+        if record.get(field) is not None:
+            record[field] = cast(record[field])
+    return record
@@ -0,0 +1,271 @@
+"""
+Sensor ingest for live exercise sessions (E-bike, Cyclette, Tapis roulant).
+
+Heart-rate, cadence and power samples arrive at 1 Hz or faster, so they bypass the
+Streamlit rerun loop: a small threaded HTTP server, started on first use inside
+the app process, accepts batched samples for an open session.
+
+    POST http://<host>:ANCHOR_INGEST_PORT/sessions/<token>/samples
+    {"t": [epoch ms, ...], "hr": [...], "cadence": [...], "power": [...]}
+
+Columns are parallel arrays; any channel may be omitted or hold nulls. Samples
+not newer than the last one received are dropped, so a retried batch is harmless.
+Each session buffers its samples in typed arrays (8 bytes per timestamp, 4 per
+value). When the session is closed they are reduced to a summary: moving
+duration, channel averages and peaks, calories, and series downsampled to
+DOWNSAMPLE_SECONDS. The summary stays on the server and is stored on the
+exercise log as 'sensor' (see outbox.save_button's `attach`).
+
+Sessions live in the memory of the process that opened them, so a device must
+post to the same instance the exercise page runs on. See simulate_device.py for
+a local feed.
+"""
+import json
+import math
+import os
+import re
+import secrets
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+INGEST_HOST = os.environ.get("ANCHOR_INGEST_HOST", "0.0.0.0")
+INGEST_PORT = int(os.environ.get("ANCHOR_INGEST_PORT", "8765"))
+SENSOR_ACTIVITIES = ("E-bike", "Cyclette", "Tapis roulant")
+CHANNELS = ("hr", "cadence", "power")
+
+MAX_BATCH_SAMPLES = 1000
+MAX_BODY_BYTES = 256 * 1024
+GAP_SECONDS = 5          # longer silences are pauses, not moving time
+DOWNSAMPLE_SECONDS = 10
+MAX_SERIES_POINTS = 720  # longer sessions get coarser buckets; the summary stays well under Firestore's 1 MiB
+SESSION_IDLE_SECONDS = 3600
+RIDER_AGE = int(os.environ.get("ANCHOR_RIDER_AGE", "45"))
+
+_PATH = re.compile(r"^/sessions/([A-Za-z0-9_-]+)/samples$")
+
+
+class SampleBuffer:
+    """One session's samples as compact typed arrays; appended from the HTTP threads."""
+
+    def __init__(self, activity):
+        self.activity = activity
+        self.t = array("d")  # epoch seconds
+        self.channels = {name: array("f") for name in CHANNELS}
+        self.lock = threading.Lock()
+        self.touched = time.time()
+
+    def extend(self, batch):
+        """Appends a columnar batch; returns the number of samples kept."""
+        times = batch["t"]
+        columns = {name: batch.get(name) or [None] * len(times) for name in CHANNELS}
+        kept = 0
+        with self.lock:
+            last = self.t[-1] if self.t else -math.inf
+            for i, ms in enumerate(times):
+                seconds = ms / 1000
+                if seconds <= last:
+                    continue
+                self.t.append(seconds)
+                for name in CHANNELS:
+                    value = columns[name][i]
+                    self.channels[name].append(math.nan if value is None else value)
+                last = seconds
+                kept += 1
+            self.touched = time.time()
+        return kept
+
+    def snapshot(self):
+        """(t, {channel: values}) as float arrays, copied under the lock."""
+        with self.lock:
+            t = np.array(self.t, dtype=np.float64)
+            channels = {name: np.array(values, dtype=np.float64) for name, values in self.channels.items()}
+        return t, channels
+
+    def latest(self):
+        """Sample count and the most recent value of each channel, for the live view."""
+        with self.lock:
+            count = len(self.t)
+            values = {name: (values[-1] if count and not math.isnan(values[-1]) else None)
+                      for name, values in self.channels.items()}
+        return count, values
+
+
+def _validate(batch):
+    if not isinstance(batch, dict) or not isinstance(batch.get("t"), list):
+        raise ValueError("batch needs a 't' array of epoch milliseconds")
+    count = len(batch["t"])
+    if count > MAX_BATCH_SAMPLES:
+        raise ValueError(f"at most {MAX_BATCH_SAMPLES} samples per batch")
+    for name in CHANNELS:
+        column = batch.get(name)
+        if column is not None and (not isinstance(column, list) or len(column) != count):
+            raise ValueError(f"'{name}' must be an array as long as 't'")
+    values = [batch["t"]] + [batch[name] for name in CHANNELS if batch.get(name) is not None]
+    for column in values:
+        for value in column:
+            if value is not None and (not isinstance(value, (int, float)) or not math.isfinite(value)):
+                raise ValueError("samples must be finite numbers or null")
+    if any(value is None for value in batch["t"]):
+        raise ValueError("'t' may not hold nulls")
+
+
+# --- Summary ---
+
+def _channel_stats(values):
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return None, None
+    return round(float(finite.mean()), 1), round(float(finite.max()), 1)
+
+
+def _downsample(t, channels, interval):
+    """Bucket means every `interval` seconds from the first sample; empty buckets are null."""
+    buckets = ((t - t[0]) // interval).astype(np.int64)
+    n_buckets = int(buckets[-1]) + 1
+    series = {"t": [i * interval for i in range(n_buckets)]}
+    for name, values in channels.items():
+        finite = np.isfinite(values)
+        if not finite.any():
+            continue
+        sums = np.bincount(buckets[finite], weights=values[finite], minlength=n_buckets)
+        counts = np.bincount(buckets[finite], minlength=n_buckets)
+        means = np.divide(sums, counts, out=np.full(n_buckets, np.nan), where=counts > 0)
+        series[name] = [None if math.isnan(v) else round(float(v), 1) for v in means]
+    return series
+
+
+def keytel_kcal_per_min(hr, weight_kg, age=RIDER_AGE):
+    """Energy expenditure from heart rate (Keytel et al. 2005, male equation, no VO2max)."""
+    return np.maximum(0.0, (-55.0969 + 0.6309 * hr + 0.1988 * weight_kg + 0.2017 * age) / 4.184)
+
+
+def summarize(t, channels, weight_kg, interval=DOWNSAMPLE_SECONDS):
+    """
+    Summary of a session's samples, or None without samples.
+    Calories come from mechanical work when power was recorded (1 kcal per kJ,
+    i.e. ~24% gross efficiency), otherwise from heart rate; None if neither was.
+    """
+    if len(t) < 2:
+        return None
+
+    dt = np.diff(t)
+    # Seconds each sample stands for; a gap ends the previous stretch instead
+    step = np.concatenate([[0.0], np.where(dt <= GAP_SECONDS, dt, 0.0)])
+    duration_s = float(step.sum())
+
+    # n points span n - 1 intervals
+    interval = max(interval, math.ceil((t[-1] - t[0]) / (MAX_SERIES_POINTS - 1)))
+    summary = {
+        "samples": int(len(t)),
+        "duration_s": int(round(duration_s)),
+        "interval_s": interval,
+    }
+    for name, values in channels.items():
+        avg, peak = _channel_stats(values)
+        if avg is not None:
+            summary[f"avg_{name}"] = avg
+            summary[f"max_{name}"] = peak
+
+    power, hr = channels["power"], channels["hr"]
+    calories = None
+    if np.isfinite(power).any():
+        kj = float(np.nansum(power * step)) / 1000
+        summary["work_kj"] = round(kj, 1)
+        calories = kj
+    elif np.isfinite(hr).any():
+        finite = np.isfinite(hr)
+        calories = float((keytel_kcal_per_min(hr[finite], weight_kg) * step[finite] / 60).sum())
+    summary["calories"] = None if calories is None else int(round(calories))
+    summary["series"] = _downsample(t, channels, interval)
+    return summary
+
+
+# --- Sessions ---
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_server = None
+
+
+def open_session(activity):
+    """Starts the ingest server if needed and returns a new session token."""
+    start()
+    token = secrets.token_urlsafe(16)
+    with _sessions_lock:
+        now = time.time()
+        for stale in [key for key, buffer in _sessions.items() if now - buffer.touched > SESSION_IDLE_SECONDS]:
+            del _sessions[stale]
+        _sessions[token] = SampleBuffer(activity)
+    return token
+
+
+def latest(token):
+    buffer = _sessions.get(token)
+    return buffer.latest() if buffer else (0, {})
+
+
+def close_session(token, weight_kg):
+    """Ends the session and returns its summary (see summarize), or None without samples."""
+    with _sessions_lock:
+        buffer = _sessions.pop(token, None)
+    if buffer is None:
+        return None
+    t, channels = buffer.snapshot()
+    return summarize(t, channels, weight_kg)
+
+
+def samples_url(token, host=None):
+    return f"http://{host or 'localhost'}:{INGEST_PORT}/sessions/{token}/samples"
+
+
+# --- HTTP Server ---
+
+class IngestHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        match = _PATH.match(self.path)
+        if not match:
+            return self._reply(404, {"error": "unknown path"})
+        buffer = _sessions.get(match.group(1))
+        if buffer is None:
+            return self._reply(404, {"error": "no open session"})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError("invalid Content-Length")
+            if length > MAX_BODY_BYTES:
+                return self._reply(413, {"error": f"body over {MAX_BODY_BYTES} bytes"})
+            batch = json.loads(self.rfile.read(length))
+            _validate(batch)
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+
+        kept = buffer.extend(batch)
+        self._reply(200, {"received": kept, "total": len(buffer.t)})
+
+    def log_message(self, format, *args):
+        # One line per batch would drown the Streamlit log
+        pass
+
+
+def start():
+    """Starts the ingest server on a daemon thread, once per process."""
+    global _server
+    with _sessions_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((INGEST_HOST, INGEST_PORT), IngestHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="sensor-ingest", daemon=True).start()
+    return _server
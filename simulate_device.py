@@ -0,0 +1,94 @@
+"""
+Simulated bike / treadmill feed for the sensor ingest endpoint (see sensor_ingest.py).
+
+    python simulate_device.py <token> [--activity Cyclette] [--minutes 20] [--hz 1] [--batch 5] [--speed 1]
+
+Start a Cyclette, E-bike or Tapis roulant session on the Exercise page; the token is
+shown under the timer. Samples are generated at --hz and posted every --batch
+seconds of simulated time; --speed 10 replays twenty minutes in two. Bikes send
+heart rate, cadence and power; the treadmill sends heart rate and step cadence.
+"""
+import argparse
+import json
+import math
+import random
+import time
+import urllib.error
+import urllib.request
+
+from sensor_ingest import samples_url
+
+PROFILES = {
+    # channel: (warm-up start, steady value, noise)
+    "Cyclette": {"hr": (95, 142, 3), "cadence": (70, 88, 4), "power": (90, 165, 12)},
+    "E-bike": {"hr": (90, 128, 4), "cadence": (60, 75, 6), "power": (60, 110, 15)},
+    "Tapis roulant": {"hr": (100, 148, 3), "cadence": (140, 162, 3)},
+}
+WARM_UP_SECONDS = 300
+
+
+def sample(profile, elapsed, state):
+    """One reading per channel: a warm-up ramp to the steady value plus a bounded random walk."""
+    ramp = min(1.0, elapsed / WARM_UP_SECONDS)
+    values = {}
+    for name, (start, steady, noise) in profile.items():
+        state[name] = max(-3 * noise, min(3 * noise, state.get(name, 0.0) + random.gauss(0, noise / 4)))
+        values[name] = round(start + (steady - start) * ramp + state[name], 1)
+    return values
+
+
+def post(url, batch, retries=3):
+    body = json.dumps(batch).encode()
+    for attempt in range(retries):
+        try:
+            request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise SystemExit(f"Ingest refused the batch: {e.code} {e.read().decode()}")
+        except OSError as e:
+            # Resending is safe: samples already received are dropped by timestamp
+            print(f"Post failed ({e}), retrying")
+            time.sleep(1 + attempt)
+    raise SystemExit("Ingest endpoint unreachable.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed simulated sensor samples to an open exercise session.")
+    parser.add_argument("token", help="Session token shown on the Exercise page")
+    parser.add_argument("--activity", choices=sorted(PROFILES), default="Cyclette")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--minutes", type=float, default=20)
+    parser.add_argument("--hz", type=float, default=1.0, help="Samples per second")
+    parser.add_argument("--batch", type=float, default=5.0, help="Seconds of samples per post")
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated seconds per real second")
+    parser.add_argument("--pause", type=float, default=0, help="Minutes of silence halfway through")
+    args = parser.parse_args()
+
+    url = samples_url(args.token, args.host)
+    profile = PROFILES[args.activity]
+    state = {}
+    start_ms = int(time.time() * 1000)
+    total = int(args.minutes * 60 * args.hz)
+    per_batch = max(1, int(args.batch * args.hz))
+    pause_ms = int(args.pause * 60_000)
+
+    sent = 0
+    while sent < total:
+        batch = {"t": [], **{name: [] for name in profile}}
+        for i in range(sent, min(total, sent + per_batch)):
+            elapsed = i / args.hz
+            offset_ms = int(elapsed * 1000) + (pause_ms if i >= total // 2 else 0)
+            batch["t"].append(start_ms + offset_ms)
+            for name, value in sample(profile, elapsed, state).items():
+                batch[name].append(value)
+        reply = post(url, batch)
+        sent += len(batch["t"])
+        print(f"{sent}/{total} samples sent, {reply['total']} buffered")
+        time.sleep(len(batch["t"]) / args.hz / args.speed)
+
+    print(f"Done: {math.ceil(total / args.hz / 60)} simulated minutes of {args.activity}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Local snapshot of the daily_logs history, shared by every worker process on the host.
+
+- logs.arrow: base snapshot, an uncompressed Arrow IPC file that is memory-mapped,
+  so processes share the same page-cache pages instead of each holding a copy.
+- delta.jsonl: canonical rows pulled from Firestore since the base was written.
+- archives.json: the monthly archive documents (see archive.py), keyed by month.
+- meta.json: the write-time watermarks of the last pull, and the history revision,
+  bumped whenever a pull brings entries or deletes dated before today, whichever
+  process wrote them (see revision()).
+
+Edited entries come back with a new write time. Deleted ones leave a tombstone
+(utils.DELETED_COLLECTION), pulled into the delta as a row flagged 'deleted'.
+
+Opt-in with ANCHOR_SNAPSHOT=1 (pyarrow required). With it, the dashboard reads
+history from here instead of Firestore: a handful of reads per refresh instead
+of the per-type projected queries and server-side KPI aggregations per load, but
+KPIs are then computed in pandas from the local rows, and the snapshot uses
+disk and page cache on every host. Worth it when many sessions share a host;
+off by default, so a single user's loads keep the server-side path.
+
+Refreshes are incremental (only documents written since the watermark) and
+serialized across processes with an exclusive file lock; reads take it shared,
+so they never see a new base next to a delta that was already folded into it. Once the delta grows past
+COMPACT_ROWS it is folded into a new base, swapped in atomically; readers
+still mapping the old file keep a valid view until they reopen.
+"""
+import datetime
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from schema import to_canonical, to_epoch_ms, local_datetime
+from archive import ARCHIVE_COLLECTION, expand_all, drop_folded, latest_live
+from utils import db, COLLECTION_NAME, DELETED_COLLECTION
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+SNAPSHOT_ENABLED = os.environ.get("ANCHOR_SNAPSHOT", "0") == "1"
+SNAPSHOT_DIR = os.environ.get("ANCHOR_SNAPSHOT_DIR", ".anchor_snapshot")
+BASE_FILE = os.path.join(SNAPSHOT_DIR, "logs.arrow")
+DELTA_FILE = os.path.join(SNAPSHOT_DIR, "delta.jsonl")
+ARCHIVES_FILE = os.path.join(SNAPSHOT_DIR, "archives.json")
+META_FILE = os.path.join(SNAPSHOT_DIR, "meta.json")
+LOCK_FILE = os.path.join(SNAPSHOT_DIR, ".lock")
+
+REFRESH_SECONDS = 30
+COMPACT_ROWS = 500
+CHANGE_LOG = 100
+
+# Canonical fields plus the document id (dedupe key) and server write time
+COLUMNS = [
+    ("id", "string"),
+    ("type", "string"),
+    ("ts_ms", "int64"),
+    ("tz_offset_min", "int32"),
+    ("date_str", "string"),
+    ("activity", "string"),
+    ("duration_minutes", "int64"),
+    ("calories", "int64"),
+    ("weight", "float64"),
+    ("written_ms", "int64"),
+    ("deleted", "bool"),
+]
+
+_lock = threading.Lock()
+_cache = {
+    "base": None, "base_key": None,
+    "delta": None, "delta_key": None,
+    "archives": None, "archives_key": None,
+    "refreshed_at": 0.0,
+}
+
+
+def enabled():
+    return SNAPSHOT_ENABLED and pa is not None and db is not None
+
+
+def _arrow_schema():
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in COLUMNS])
+
+
+@contextmanager
+def _file_lock(exclusive=True):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_meta():
+    try:
+        with open(META_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"watermark_ms": 0, "watermark_ids": [], "delta_rows": 0, "archive_watermark_ms": 0,
+                "tombstone_watermark_ms": 0, "tombstone_ids": [], "history_revision": 0, "history_changes": []}
+
+
+def revision():
+    """Host-wide revision of the closed days, as of the last refresh by any process."""
+    return _read_meta().get("history_revision", 0)
+
+
+def changed_days(since_revision):
+    """Closed days changed after `since_revision` (see revision()), or None once no longer recorded."""
+    meta = _read_meta()
+    changes = meta.get("history_changes", [])
+    if meta.get("history_revision", 0) > since_revision and (not changes or changes[0][0] > since_revision + 1):
+        return None
+    return [datetime.date.fromisoformat(day) for revision, day in changes if revision > since_revision]
+
+
+def _earliest_closed_day(rows):
+    """Earliest local day before today among pulled rows (tombstones included), or None."""
+    today = datetime.date.today()
+    days = [local_datetime(row["ts_ms"], row["tz_offset_min"] or 0).date() for row in rows]
+    return min((day for day in days if day < today), default=None)
+
+
+def _write_meta(meta):
+    tmp = META_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, META_FILE)
+
+
+def _to_row(doc_id, data):
+    data = to_canonical(data)
+    written = data.get("timestamp")
+    row = {name: data.get(name) for name, _ in COLUMNS}
+    row["id"] = doc_id
+    row["written_ms"] = to_epoch_ms(written) if isinstance(written, datetime.datetime) else None
+    return row
+
+
+def _pull(watermark_ms):
+    """Documents written at or after the watermark (>= so same-ms writes are not lost)."""
+    since = datetime.datetime.fromtimestamp(watermark_ms / 1000, tz=datetime.timezone.utc)
+    query = (
+        db.collection(COLLECTION_NAME)
+        .where(filter=FieldFilter("timestamp", ">=", since))
+        .order_by("timestamp")
+    )
+    return [_to_row(doc.id, doc.to_dict()) for doc in db.get(query, timeout=30)]
+
+
+def _pull_archives(watermark_ms):
+    """Archive documents touched by a compaction run since the watermark."""
+    query = db.collection(ARCHIVE_COLLECTION).where(filter=FieldFilter("compacted_at_ms", ">=", watermark_ms))
+    return [doc.to_dict() for doc in db.get(query, timeout=30)]
+
+
+def _pull_tombstones(watermark_ms):
+    """
+    Delete markers committed since the watermark, as rows that shadow the deleted
+    entry's id. Paged on the server commit time, as entries are, so neither a
+    delete committed after another process's refresh nor a skewed app-server
+    clock can land behind the watermark.
+    """
+    since = datetime.datetime.fromtimestamp(watermark_ms / 1000, tz=datetime.timezone.utc)
+    query = db.collection(DELETED_COLLECTION).where(filter=FieldFilter("deleted_at", ">=", since))
+    rows = []
+    for doc in db.get(query, timeout=30):
+        data = doc.to_dict()
+        row = {name: None for name, _ in COLUMNS}
+        row.update(id=doc.id, type=data["type"], ts_ms=data["ts_ms"], tz_offset_min=data["tz_offset_min"],
+                   written_ms=to_epoch_ms(data["deleted_at"]), deleted=True)
+        rows.append(row)
+    return rows
+
+
+def invalidate():
+    """Makes the next read in this process refresh, e.g. right after an edit."""
+    with _lock:
+        _cache["refreshed_at"] = 0.0
+
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _base_table():
+    """Memory-mapped base snapshot, reopened only when the file is replaced."""
+    key = _file_key(BASE_FILE)
+    if key is None:
+        return _arrow_schema().empty_table()
+    if key != _cache["base_key"]:
+        source = pa.memory_map(BASE_FILE, "r")
+        _cache["base"] = pa.ipc.open_file(source).read_all()
+        _cache["base_key"] = key
+    return _cache["base"]
+
+
+def _delta_rows():
+    key = _file_key(DELTA_FILE)
+    if key is None:
+        return []
+    if key != _cache["delta_key"]:
+        with open(DELTA_FILE) as f:
+            _cache["delta"] = [json.loads(line) for line in f if line.strip()]
+        _cache["delta_key"] = key
+    return _cache["delta"]
+
+
+def _archives():
+    key = _file_key(ARCHIVES_FILE)
+    if key is None:
+        return {}
+    if key != _cache["archives_key"]:
+        with open(ARCHIVES_FILE) as f:
+            _cache["archives"] = json.load(f)
+        _cache["archives_key"] = key
+    return _cache["archives"]
+
+
+def _write_archives(archives):
+    tmp = ARCHIVES_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(archives, f)
+    os.replace(tmp, ARCHIVES_FILE)
+
+
+def _compact():
+    """Folds the delta into a new base file. Caller holds the file lock."""
+    rows = _base_table().to_pylist() + _delta_rows()
+    latest = {}
+    for row in rows:
+        latest[row["id"]] = row
+    # A tombstone has already shadowed its entry in the rows above; neither is kept
+    live = [row for row in latest.values() if not row.get("deleted")]
+    table = pa.Table.from_pylist(live, schema=_arrow_schema())
+
+    tmp = BASE_FILE + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, BASE_FILE)
+    open(DELTA_FILE, "w").close()
+
+
+def refresh():
+    """Pulls documents written since the last watermark into the delta log."""
+    with _file_lock():
+        meta = _read_meta()
+        # The >= pull returns the documents at the watermark again; skip those
+        seen = set(meta["watermark_ids"])
+        rows = [row for row in _pull(meta["watermark_ms"]) if row["id"] not in seen]
+        # Same >= pull and same-ms dedupe as the entries below
+        seen_tombstones = set(meta.get("tombstone_ids", []))
+        tombstones = [
+            row for row in _pull_tombstones(meta.get("tombstone_watermark_ms", 0))
+            if row["id"] not in seen_tombstones
+        ]
+        if tombstones:
+            with open(DELTA_FILE, "a") as f:
+                for row in tombstones:
+                    f.write(json.dumps(row) + "\n")
+            tombstone_ms = max(meta.get("tombstone_watermark_ms", 0), *(row["written_ms"] for row in tombstones))
+            if tombstone_ms != meta.get("tombstone_watermark_ms", 0):
+                seen_tombstones = set()
+            meta["tombstone_watermark_ms"] = tombstone_ms
+            meta["tombstone_ids"] = sorted(seen_tombstones | {row["id"] for row in tombstones if row["written_ms"] == tombstone_ms})
+            meta["delta_rows"] += len(tombstones)
+        if rows:
+            with open(DELTA_FILE, "a") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            watermark_ms = max(meta["watermark_ms"], *(row["written_ms"] or 0 for row in rows))
+            if watermark_ms != meta["watermark_ms"]:
+                seen = set()
+            meta["watermark_ms"] = watermark_ms
+            meta["watermark_ids"] = sorted(seen | {row["id"] for row in rows if row["written_ms"] == watermark_ms})
+            meta["delta_rows"] += len(rows)
+
+        changed = _earliest_closed_day(rows + tombstones)
+        if changed is not None:
+            meta["history_revision"] = meta.get("history_revision", 0) + 1
+            changes = meta.get("history_changes", []) + [[meta["history_revision"], changed.isoformat()]]
+            meta["history_changes"] = changes[-CHANGE_LOG:]
+
+        archives = _pull_archives(meta.get("archive_watermark_ms", 0))
+        if archives:
+            merged = dict(_archives())
+            merged.update({archive["month"]: archive for archive in archives})
+            _write_archives(merged)
+            meta["archive_watermark_ms"] = max(archive["compacted_at_ms"] for archive in archives)
+
+        if meta["delta_rows"] >= COMPACT_ROWS:
+            _compact()
+            meta["delta_rows"] = 0
+        _write_meta(meta)
+
+
+def _history_table(start_ms=None, log_type=None, superseded=()):
+    """Base rows in range, without the ids in `superseded` (rewritten or deleted since)."""
+    table = _base_table()
+    if superseded:
+        table = table.filter(pc.invert(pc.is_in(table["id"], value_set=pa.array(list(superseded), pa.string()))))
+    if start_ms is not None:
+        table = table.filter(pc.greater_equal(table["ts_ms"], start_ms))
+    if log_type is not None:
+        table = table.filter(pc.equal(table["type"], log_type))
+    return table
+
+
+def load_history(start_date=None, log_type=None):
+    """
+    Canonical history since start_date as a DataFrame: base snapshot + delta,
+    deduplicated by document id, with archived months expanded to daily totals.
+    Versions are resolved before the range and type filters, so an entry edited
+    out of the range, or deleted, doesn't leave its base row behind.
+    Refreshes from Firestore at most every REFRESH_SECONDS.
+    Only the requested slice leaves the memory-mapped table.
+    """
+    start_ms = to_epoch_ms(start_date) if start_date else None
+    with _lock:
+        if time.time() - _cache["refreshed_at"] > REFRESH_SECONDS:
+            refresh()
+            _cache["refreshed_at"] = time.time()
+
+        # Base, delta and archives from the same generation, not across another process's compaction
+        with _file_lock(exclusive=False):
+            # Latest delta version per id, whatever its range: it supersedes the base row
+            latest = {row["id"]: row for row in _delta_rows()}
+            base = _history_table(start_ms, log_type, superseded=latest.keys()).to_pandas()
+            delta = [
+                row for row in latest.values()
+                if (start_ms is None or row["ts_ms"] >= start_ms)
+                and (log_type is None or row["type"] == log_type)
+            ]
+            archives = _archives()
+
+    history = latest_live(pd.concat([base, pd.DataFrame(delta)], ignore_index=True) if delta else base)
+    history = drop_folded(history, archives)
+
+    archived = [
+        row for row in expand_all(archives.values(), start_ms)
+        if log_type is None or row["type"] == log_type
+    ]
+    if archived:
+        history = pd.concat([history, pd.DataFrame(archived)], ignore_index=True)
+    return history
+
+
+def latest_rows(log_type, limit=1):
+    """Newest rows of one type, as dicts, e.g. the latest weight."""
+    history = load_history(log_type=log_type)
+    return history.nlargest(limit, "ts_ms").to_dict("records")
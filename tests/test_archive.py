@@ -0,0 +1,104 @@
+import copy
+import datetime
+
+import pandas as pd
+
+from archive import empty_archive, fold, expand, drop_folded
+
+MONTH = "2025-03"
+
+
+def entry(day, log_type, hour=9, **fields):
+    when = datetime.datetime(2025, 3, day, hour, tzinfo=datetime.timezone.utc)
+    return {"type": log_type, "ts_ms": int(when.timestamp() * 1000), "tz_offset_min": 0,
+            "date_str": when.date().isoformat(), **fields}
+
+
+def test_days_stay_sorted_when_one_is_inserted_in_the_middle():
+    archive = fold(empty_archive(MONTH), [
+        entry(2, "meditation", duration_minutes=10),
+        entry(9, "meditation", duration_minutes=20),
+        entry(9, "exercise", activity="Cyclette", duration_minutes=30, calories=250),
+    ], 0, 0)
+    fold(archive, [entry(5, "meditation", duration_minutes=15), entry(5, "weight", weight=80.0)], 0, 0)
+
+    assert archive["days"] == [2, 5, 9]
+    assert archive["meditation_minutes"] == [10, 15, 20]
+    assert archive["weight"] == [None, 80.0, None]
+    assert archive["exercise"]["Cyclette"] == {"minutes": [0, 0, 30], "calories": [0, 0, 250]}
+
+
+def test_a_new_activity_is_zero_filled_for_existing_days():
+    archive = fold(empty_archive(MONTH), [
+        entry(1, "meditation", duration_minutes=10),
+        entry(3, "exercise", activity="E-bike", duration_minutes=40, calories=300),
+    ], 0, 0)
+    fold(archive, [entry(3, "exercise", activity="Stretching", duration_minutes=10, calories=30),
+                   entry(4, "exercise", duration_minutes=5, calories=20)], 0, 0)
+
+    assert archive["days"] == [1, 3, 4]
+    assert archive["exercise"]["E-bike"] == {"minutes": [0, 40, 0], "calories": [0, 300, 0]}
+    assert archive["exercise"]["Stretching"] == {"minutes": [0, 10, 0], "calories": [0, 30, 0]}
+    # No activity is filed as "Vario"
+    assert archive["exercise"]["Vario"] == {"minutes": [0, 0, 5], "calories": [0, 0, 20]}
+
+
+def test_last_weight_of_the_day_wins():
+    archive = fold(empty_archive(MONTH), [
+        entry(7, "weight", hour=7, weight=80.4),
+        entry(7, "weight", hour=21, weight=79.8),
+    ], 0, 0)
+    assert archive["weight"] == [79.8]
+    assert [row["weight"] for row in expand(archive)] == [79.8]
+
+
+def test_rerun_after_an_interrupted_run_counts_each_entry_once():
+    rows = [
+        entry(1, "meditation", duration_minutes=10),
+        entry(1, "exercise", activity="Cyclette", duration_minutes=20, calories=150),
+        entry(2, "weight", weight=80.0),
+        entry(3, "meditation", duration_minutes=5),
+    ]
+    whole = fold(empty_archive(MONTH), copy.deepcopy(rows), 1000, 2000)
+    # The first batch committed (archive + its deletes); the re-run sees only the rest
+    first = fold(empty_archive(MONTH), copy.deepcopy(rows[:2]), 1000, 2000)
+    resumed = fold(copy.deepcopy(first), copy.deepcopy(rows[2:]), 900, 3000)
+
+    assert {key: resumed[key] for key in ("days", "meditation_minutes", "weight", "exercise")} == \
+        {key: whole[key] for key in ("days", "meditation_minutes", "weight", "exercise")}
+    # Bounds only move forward
+    assert resumed["through_ms"] == 1000
+    assert resumed["compacted_at_ms"] == 3000
+
+
+def test_expand_gives_daily_totals_at_noon():
+    archive = fold(empty_archive(MONTH), [
+        entry(4, "meditation", duration_minutes=10),
+        entry(4, "meditation", hour=20, duration_minutes=5),
+        entry(6, "exercise", activity="Cyclette", duration_minutes=30, calories=200),
+    ], 0, 0)
+    rows = expand(archive)
+    assert [(row["date_str"], row["type"]) for row in rows] == [("2025-03-04", "meditation"), ("2025-03-06", "exercise")]
+    assert rows[0]["duration_minutes"] == 15
+    assert rows[0]["archived"] is True
+
+    noon_6th = int(datetime.datetime(2025, 3, 6, 12, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    assert [row["date_str"] for row in expand(archive, start_ms=noon_6th)] == ["2025-03-06"]
+
+
+def test_drop_folded_keeps_rows_outside_the_archive_bounds():
+    through_ms = entry(10, "meditation", hour=0)["ts_ms"]
+    archives = {MONTH: {"through_ms": through_ms, "compacted_at_ms": 5000}}
+    history = pd.DataFrame([
+        {"id": "folded", **entry(9, "meditation"), "written_ms": 4000},
+        {"id": "at_bound", **entry(10, "meditation", hour=0), "written_ms": 4000},
+        {"id": "written_later", **entry(9, "meditation"), "written_ms": 6000},
+        {"id": "no_write_time", **entry(9, "meditation"), "written_ms": None},
+        {"id": "other_month", "type": "meditation", "ts_ms": 0, "tz_offset_min": 0,
+         "date_str": "2025-02-01", "written_ms": 4000},
+    ])
+
+    kept = drop_folded(history, archives)
+    # A backdated entry written after the compaction is not in the archive
+    assert kept["id"].tolist() == ["at_bound", "written_later", "other_month"]
+    assert drop_folded(history, {}) is history
@@ -0,0 +1,140 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from modules.metrics import TrendSeries, prepare_logs, streak_lengths, fit_line
+
+FIRST_DAY = datetime.date(2026, 1, 1)
+
+
+def row(log_type, day, **fields):
+    """A canonical log at noon UTC of FIRST_DAY + day."""
+    when = datetime.datetime.combine(FIRST_DAY + datetime.timedelta(days=day), datetime.time(12))
+    ts_ms = int((when - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    return {'type': log_type, 'ts_ms': ts_ms, 'tz_offset_min': 0, **fields}
+
+
+def day(offset):
+    return FIRST_DAY + datetime.timedelta(days=offset)
+
+
+def series_through(rows, last_day):
+    series = TrendSeries(FIRST_DAY)
+    series.extend(prepare_logs(rows), day(last_day))
+    return series
+
+
+HISTORY = [
+    row('meditation', 0, duration_minutes=10),
+    row('meditation', 1, duration_minutes=20),
+    row('exercise', 1, duration_minutes=30, calories=200),
+    # day 2: nothing logged
+    row('meditation', 3, duration_minutes=5),
+]
+
+
+def test_streak_lengths_restart_after_a_missing_day():
+    assert streak_lengths([True, True, False, True]).tolist() == [1, 2, 0, 1]
+
+
+def test_streak_lengths_continue_the_carried_run():
+    assert streak_lengths([True, True, False, True], carry=2).tolist() == [3, 4, 0, 1]
+    assert streak_lengths([False, True], carry=5).tolist() == [0, 1]
+    assert streak_lengths([]).tolist() == []
+
+
+def test_rolling_averages_and_streaks_include_today():
+    series = series_through(HISTORY, 3)
+    summary = series.summary(prepare_logs([row('meditation', 4, duration_minutes=15)]), day(4))
+
+    # Five days of history (days 0-4) are shorter than either window: 50 min / 5 days
+    assert summary['rolling']['meditation'] == {7: 10.0, 30: 10.0}
+    assert summary['rolling']['exercise'] == {7: 6.0, 30: 6.0}
+    # Meditation: day 3 and today; day 2 broke the first run of two
+    assert summary['streaks']['meditation'] == {'current': 2, 'longest': 2}
+    assert summary['streaks']['exercise'] == {'current': 0, 'longest': 1}
+
+
+def test_open_day_without_entries_keeps_yesterdays_streak():
+    series = series_through(HISTORY, 3)
+    summary = series.summary(prepare_logs([]), day(4))
+    assert summary['streaks']['meditation'] == {'current': 1, 'longest': 2}
+
+
+def test_prefix_sum_windows_drop_days_outside_the_window():
+    rows = [row('meditation', 0, duration_minutes=100)]
+    rows += [row('meditation', offset, duration_minutes=1) for offset in range(1, 10)]
+    summary = series_through(rows, 9).summary(prepare_logs([]), day(10))
+
+    # 7d: days 4-10 hold 6 minutes; 30d: all 11 days hold 109
+    assert summary['rolling']['meditation'][7] == pytest.approx(6 / 7)
+    assert summary['rolling']['meditation'][30] == pytest.approx(109 / 11)
+    chart = summary['chart']
+    assert len(chart) == 11
+    assert chart['meditation_7d'].iloc[0] == pytest.approx(100.0)
+    assert chart['meditation_7d'].iloc[-1] == pytest.approx(6 / 7)
+
+
+def test_extending_in_steps_matches_a_single_build():
+    whole = series_through(HISTORY, 3)
+    steps = TrendSeries(FIRST_DAY)
+    steps.extend(prepare_logs(HISTORY[:3]), day(1))
+    steps.extend(prepare_logs(HISTORY[3:]), day(3))
+
+    assert steps.last_day == whole.last_day == day(3)
+    for kind in ('meditation', 'exercise'):
+        assert np.array_equal(steps.cumulative[kind], whole.cumulative[kind])
+        assert np.array_equal(steps.streaks[kind], whole.streaks[kind])
+        assert steps.longest[kind] == whole.longest[kind]
+
+
+def test_extend_ignores_days_already_closed():
+    series = series_through(HISTORY, 3)
+    series.extend(prepare_logs([row('meditation', 2, duration_minutes=60)]), day(3))
+    assert series.days == 4
+    assert series.cumulative['meditation'][-1] == 35
+
+
+def test_weight_fit_over_the_prefix_terms():
+    rows = HISTORY + [row('weight', 0, weight=80.0), row('weight', 2, weight=79.0)]
+    summary = series_through(rows, 3).summary(prepare_logs([]), day(4))
+
+    # Through (0, 80) and (2, 79): -0.5 kg per day
+    assert summary['weight_rate'] == -3.5
+    assert summary['weight_fit']['weight'].tolist() == pytest.approx([80.0, 78.0])
+
+
+def test_weight_fit_needs_two_points():
+    summary = series_through(HISTORY + [row('weight', 1, weight=80.0)], 3).summary(prepare_logs([]), day(4))
+    assert summary['weight_rate'] is None
+    assert summary['weight_fit'] is None
+    assert fit_line(np.array([2, 2, 160, 2, 160])) is None  # both points on the same day
+
+
+def test_truncate_and_extend_matches_a_full_rebuild():
+    edited = HISTORY + [row('meditation', 2, duration_minutes=40), row('weight', 2, weight=79.0)]
+    rebuilt = series_through(edited, 3)
+
+    series = series_through(HISTORY + [row('weight', 0, weight=80.0)], 3)
+    assert series.truncate(day(2))
+    assert series.last_day == day(1)
+    # Days from the changed one on are read again
+    series.extend(prepare_logs([r for r in edited if r['ts_ms'] >= row('meditation', 2)['ts_ms'] - 12 * 3600_000]), day(3))
+
+    for kind in ('meditation', 'exercise'):
+        assert np.array_equal(series.cumulative[kind], rebuilt.cumulative[kind])
+        assert np.array_equal(series.streaks[kind], rebuilt.streaks[kind])
+        assert series.longest[kind] == rebuilt.longest[kind]
+    assert series.longest['meditation'] == 4
+    summary = series.summary(prepare_logs([]), day(4))
+    # Weight on day 0 kept from before the cut, day 2 re-read: (0, 80) and (2, 79)
+    assert summary['weight_rate'] == -3.5
+
+
+def test_truncate_at_the_first_day_asks_for_a_new_series():
+    series = series_through(HISTORY, 3)
+    assert not series.truncate(day(0))
+    assert series.days == 4
+    assert series.truncate(day(9))
+    assert series.days == 4
@@ -0,0 +1,53 @@
+import datetime
+import json
+
+from modules.metrics import prepare_logs
+from report import _read_snapshot_dir, summarize
+
+WEEK_START = datetime.datetime(2026, 3, 2)
+
+
+def entry(doc_id, log_type, day, **fields):
+    when = WEEK_START + datetime.timedelta(days=day, hours=12)
+    ts_ms = int((when - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    return {"id": doc_id, "type": log_type, "ts_ms": ts_ms, "tz_offset_min": 0,
+            "date_str": when.date().isoformat(), "written_ms": ts_ms, **fields}
+
+
+def tombstone(row):
+    # As snapshot._pull_tombstones writes it: only the keys needed to place the row
+    return {"id": row["id"], "type": row["type"], "ts_ms": row["ts_ms"], "tz_offset_min": row["tz_offset_min"],
+            "date_str": None, "duration_minutes": None, "calories": None, "weight": None,
+            "written_ms": row["written_ms"] + 1, "deleted": True}
+
+
+def write_delta(path, rows):
+    with open(path / "delta.jsonl", "w") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def test_deleted_entries_are_not_reported(tmp_path):
+    meditation = entry("m1", "meditation", 0, duration_minutes=20)
+    weight = entry("w1", "weight", 1, weight=80.0)
+    kept = entry("w2", "weight", 2, weight=79.5)
+    write_delta(tmp_path, [meditation, weight, kept, tombstone(meditation), tombstone(weight)])
+
+    history = _read_snapshot_dir(str(tmp_path))
+    assert sorted(history["id"]) == ["w2"]
+    assert "deleted" not in history
+
+    report = summarize(prepare_logs(history), WEEK_START, WEEK_START + datetime.timedelta(days=7))
+    assert report["totals"]["meditation_sessions"] == 0
+    assert report["totals"]["meditation_minutes"] == 0
+    assert report["weight"] == {"first": 79.5, "last": 79.5, "delta": 0.0}
+    json.dumps(report, allow_nan=False)
+
+
+def test_an_edit_replaces_the_earlier_version(tmp_path):
+    original = entry("m1", "meditation", 0, duration_minutes=20)
+    edited = {**original, "duration_minutes": 25, "written_ms": original["written_ms"] + 1}
+    write_delta(tmp_path, [original, edited])
+
+    history = _read_snapshot_dir(str(tmp_path))
+    assert history["duration_minutes"].tolist() == [25]
@@ -0,0 +1,69 @@
+import datetime
+import time
+
+import pytest
+
+from schema import to_canonical, local_datetime, SCHEMA_VERSION
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture(autouse=True)
+def rome_time(monkeypatch):
+    """Legacy times are local wall time: pin the zone (UTC+1 in January)."""
+    monkeypatch.setenv("TZ", "Europe/Rome")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def epoch_ms(*args):
+    return int(datetime.datetime(*args, tzinfo=UTC).timestamp() * 1000)
+
+
+def test_utc_labelled_completed_at_is_local_wall_time():
+    # Stored as local 08:30; Firestore hands it back labelled UTC
+    record = to_canonical({"type": "meditation", "duration_minutes": 10,
+                           "completed_at": datetime.datetime(2025, 1, 10, 8, 30, tzinfo=UTC)})
+    assert record["ts_ms"] == epoch_ms(2025, 1, 10, 7, 30)
+    assert record["tz_offset_min"] == 60
+    assert record["date_str"] == "2025-01-10"
+    assert "completed_at" not in record
+    assert local_datetime(record["ts_ms"], record["tz_offset_min"]) == datetime.datetime(2025, 1, 10, 8, 30)
+
+
+def test_naive_offline_timestamp_is_local():
+    record = to_canonical({"type": "weight", "weight": 80, "timestamp": datetime.datetime(2025, 1, 10, 23, 30)})
+    assert record["ts_ms"] == epoch_ms(2025, 1, 10, 22, 30)
+    assert record["date_str"] == "2025-01-10"
+
+
+def test_firestore_timestamp_falls_on_the_local_day():
+    record = to_canonical({"type": "weight", "weight": 80, "timestamp": datetime.datetime(2025, 1, 10, 23, 30, tzinfo=UTC)})
+    assert record["ts_ms"] == epoch_ms(2025, 1, 10, 23, 30)
+    assert record["date_str"] == "2025-01-11"
+
+
+def test_date_str_only_entries_sit_at_local_noon():
+    record = to_canonical({"type": "meditation", "duration_minutes": 5, "date_str": "2025-01-10"})
+    assert record["ts_ms"] == epoch_ms(2025, 1, 10, 11)
+    assert record["date_str"] == "2025-01-10"
+    assert record["schema_version"] == SCHEMA_VERSION
+
+
+def test_numerics_are_cast_and_unknown_fields_kept():
+    record = to_canonical({"type": "exercise", "activity": "Cyclette", "duration_minutes": "30",
+                           "calories": 212.0, "weight": None, "note": "legs", "date_str": "2025-01-10"})
+    assert record["duration_minutes"] == 30 and isinstance(record["duration_minutes"], int)
+    assert record["calories"] == 212 and isinstance(record["calories"], int)
+    assert record["weight"] is None
+    assert record["note"] == "legs"
+    assert isinstance(to_canonical({"type": "weight", "weight": "78", "date_str": "2025-01-10"})["weight"], float)
+
+
+def test_canonical_input_is_returned_unchanged():
+    record = {"schema_version": SCHEMA_VERSION, "type": "weight", "weight": "not cast",
+              "ts_ms": 1, "tz_offset_min": 0, "date_str": "1970-01-01"}
+    assert to_canonical(record) is record
+    assert record["weight"] == "not cast"
@@ -0,0 +1,108 @@
+import math
+
+import numpy as np
+import pytest
+
+import sensor_ingest
+from sensor_ingest import SampleBuffer, summarize, keytel_kcal_per_min, _downsample, _validate
+
+
+def channels(n, **values):
+    """Float channels of n samples; omitted channels are all NaN."""
+    return {
+        name: np.array(values[name], dtype=np.float64) if name in values else np.full(n, np.nan)
+        for name in sensor_ingest.CHANNELS
+    }
+
+
+def test_summary_needs_two_samples():
+    assert summarize(np.array([0.0]), channels(1, hr=[100]), 70) is None
+
+
+def test_gaps_over_the_threshold_are_not_moving_time():
+    t = np.array([0.0, 1, 2, 3, 10, 11])
+    summary = summarize(t, channels(6, cadence=[80] * 6), 70)
+    # 7 s between 3 and 10 is a pause: 3 s before it, 1 s after
+    assert summary['duration_s'] == 4
+    assert summary['samples'] == 6
+
+
+def test_a_gap_at_the_threshold_still_counts():
+    t = np.array([0.0, sensor_ingest.GAP_SECONDS])
+    assert summarize(t, channels(2, cadence=[80, 80]), 70)['duration_s'] == sensor_ingest.GAP_SECONDS
+
+
+def test_calories_from_power_win_over_heart_rate():
+    t = np.arange(61, dtype=np.float64)
+    summary = summarize(t, channels(61, power=[200] * 61, hr=[150] * 61), 70)
+    # 200 W for 60 s = 12 kJ; 1 kcal per kJ of work
+    assert summary['work_kj'] == 12.0
+    assert summary['calories'] == 12
+    assert summary['avg_power'] == 200.0
+
+
+def test_calories_from_heart_rate_without_power():
+    assert keytel_kcal_per_min(np.array([120.0]), 70, age=45)[0] == pytest.approx(10.4215, abs=1e-4)
+    assert keytel_kcal_per_min(np.array([40.0]), 50, age=20)[0] == 0.0
+
+    t = np.arange(0, 601, dtype=np.float64)
+    summary = summarize(t, channels(601, hr=[120] * 601), 70)
+    expected = keytel_kcal_per_min(np.array([120.0]), 70)[0] * 10
+    assert 'work_kj' not in summary
+    assert summary['calories'] == round(expected)
+
+
+def test_no_calories_without_power_or_heart_rate():
+    summary = summarize(np.array([0.0, 1.0]), channels(2, cadence=[80, 82]), 70)
+    assert summary['calories'] is None
+    assert summary['avg_cadence'] == 81.0
+    assert 'avg_hr' not in summary
+
+
+def test_channel_stats_skip_missing_samples():
+    summary = summarize(np.array([0.0, 1, 2]), channels(3, hr=[100, np.nan, 120]), 70)
+    assert summary['avg_hr'] == 110.0
+    assert summary['max_hr'] == 120.0
+
+
+def test_downsample_leaves_empty_buckets_null():
+    t = np.array([0.0, 1, 2, 25])
+    series = _downsample(t, channels(4, hr=[100, 110, 120, 130]), 10)
+    assert series['t'] == [0, 10, 20]
+    assert series['hr'] == [110.0, None, 130.0]
+    # Channels without any sample are left out
+    assert 'power' not in series
+
+
+def test_long_sessions_get_coarser_buckets():
+    span = 4 * 3600.0
+    summary = summarize(np.array([0.0, span]), channels(2, hr=[100, 100]), 70)
+    assert summary['interval_s'] > sensor_ingest.DOWNSAMPLE_SECONDS
+    assert len(summary['series']['t']) <= sensor_ingest.MAX_SERIES_POINTS
+
+
+def test_buffer_drops_samples_not_newer_than_the_last():
+    buffer = SampleBuffer("Cyclette")
+    assert buffer.extend({'t': [1000, 2000], 'hr': [100, 101]}) == 2
+    # A retried batch overlapping the last sample
+    assert buffer.extend({'t': [2000, 3000], 'hr': [101, None]}) == 1
+    count, values = buffer.latest()
+    assert count == 3
+    assert values == {'hr': None, 'cadence': None, 'power': None}
+
+    t, recorded = buffer.snapshot()
+    assert t.tolist() == [1.0, 2.0, 3.0]
+    assert recorded['hr'][:2].tolist() == [100.0, 101.0]
+    assert math.isnan(recorded['hr'][2])
+
+
+@pytest.mark.parametrize("batch", [
+    {'hr': [100]},
+    {'t': [1000, 2000], 'hr': [100]},
+    {'t': [1000], 'hr': [float('inf')]},
+    {'t': [None]},
+    {'t': [1000], 'power': ['200']},
+])
+def test_validate_rejects_malformed_batches(batch):
+    with pytest.raises(ValueError):
+        _validate(batch)
@@ -4,6 +4,16 @@ import streamlit as st
 import datetime
 import json
 import os
+import re
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.aggregation import AggregationQuery
+from schema import to_canonical, to_epoch_ms, is_canonical, local_datetime, NUMERIC_FIELDS, SCHEMA_VERSION
+from archive import ARCHIVE_COLLECTION, expand_all
+import metering
 
 # --- Firestore Setup ---
 # Check if app is already initialized to avoid errors on reload
@@ -38,7 +48,8 @@ if not firebase_admin._apps:
 try:
     # Attempt to get client, but handle failure gracefully
     if firebase_admin._apps:
-        db = firestore.client()
+        # Every query and write is billed per document; the wrapper counts them (see metering.py)
+        db = metering.MeteredClient(firestore.client())
     else:
         db = None
 except Exception as e:
@@ -46,6 +57,29 @@ except Exception as e:
     db = None
 
 COLLECTION_NAME = "daily_logs"
+# One tombstone per deleted entry, so snapshot refreshes (see snapshot.py) see deletes
+DELETED_COLLECTION = "daily_logs_deleted"
+LOG_TYPES = ("meditation", "exercise", "weight")
+HISTORY_PAGE_SIZE = 20
+
+# Shared by all sessions; each query blocks on network, not CPU. One dashboard load
+# issues 8 queries (3 types, archive, latest weight, 3 KPIs), so the default leaves
+# room for four loads in flight, e.g. a login warm-up and three sessions, before queueing
+QUERY_WORKERS = int(os.environ.get("ANCHOR_QUERY_WORKERS", "32"))
+_query_pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="firestore-query")
+
+# Log fields accepted from the browser outbox, and the shape of its client-generated ids
+OUTBOX_FIELDS = ("type", "activity", "duration_minutes", "calories", "weight", "ts_ms", "tz_offset_min")
+_OUTBOX_ID = re.compile(r"^[0-9a-f-]{32,36}$")
+MAX_BATCH_WRITES = 500
+
+# Bumped by committed writes dated before today; caches of closed days rebuild when it moves,
+# from the earliest day changed since (see history_changed_days).
+# It counts this process's writes only: see snapshot.revision() for the other processes'
+HISTORY_CHANGE_LOG = 100
+_history_revision = 0
+_history_changes = deque(maxlen=HISTORY_CHANGE_LOG)  # (revision, day)
+_history_lock = threading.Lock()
 
 # --- Offline Fallback ---
 if 'offline_logs' not in st.session_state:
@@ -54,19 +88,18 @@ if 'offline_logs' not in st.session_state:
 
 def save_log(data: dict):
     """
-    Saves a dictionary of data to Firestore with a timestamp.
+    Saves a dictionary of data to Firestore in the canonical schema (see schema.py).
     Falls back to simple session_state storage if DB is unavailable.
     """
-    # Timestamp generation (if not already provided)
-    if 'date_str' not in data:
-        data['date_str'] = datetime.datetime.now().strftime("%Y-%m-%d")
+    # Event time defaults to now; epoch ms, tz offset, typed numerics and version tag
+    data = _stage_write(to_canonical(data))
     
     # Try Cloud Firestore
-    if db is not None and not st.session_state.get('force_offline', False):
+    if is_online():
         try:
-            # Add a server timestamp
-            data['timestamp'] = firestore.SERVER_TIMESTAMP
-            db.collection(COLLECTION_NAME).add(data)
+            # Add a server timestamp (write time; event time is ts_ms)
+            db.add(db.collection(COLLECTION_NAME), {**data, 'timestamp': firestore.SERVER_TIMESTAMP})
+            _written(data['date_str'])
             return True
         except Exception as e:
             # 403 or other errors -> Fallback
@@ -78,56 +111,351 @@ def save_log(data: dict):
     # Fallback: Local Session State
     # Simulate server timestamp with local time for consistency
     data['timestamp'] = datetime.datetime.now()
-    data['datetime'] = data['timestamp'] # Helper for pandas
     st.session_state['offline_logs'].append(data)
     return True
 
-def get_logs(start_date=None, end_date=None, limit=None):
+def _stage_write(data):
+    # Any warmed-up dashboard data no longer includes this entry
+    st.session_state.pop('dashboard_prefetch', None)
+    return data
+
+def _written(*date_strs):
     """
-    Retrieves logs from Firestore + Local Offline logs.
+    After a committed write of entries dated `date_strs`: the next snapshot read in
+    this process pulls it, then closed-day caches rebuild if a date is before today.
+    In this order, a rebuild triggered by the new revision reads the new entry.
     """
-    logs = []
-    
-    # 1. Fetch from Firestore if available
-    # Check manual offline override
-    if db is not None and not st.session_state.get('force_offline', False):
+    import snapshot  # snapshot imports this module
+    if snapshot.enabled():
+        snapshot.invalidate()
+    if date_strs and min(date_strs) < datetime.date.today().isoformat():
+        mark_history_changed(datetime.date.fromisoformat(min(date_strs)))
+
+def _outbox_entry(entry):
+    """Canonical log from a browser outbox entry, keeping only log fields; None if malformed."""
+    if entry.get('type') not in LOG_TYPES:
+        return None
+    try:
+        data = {field: entry[field] for field in OUTBOX_FIELDS if entry.get(field) is not None}
+        data['ts_ms'] = int(data['ts_ms'])
+        data['tz_offset_min'] = int(data['tz_offset_min'])
+        for field, cast in NUMERIC_FIELDS.items():
+            if field in data:
+                data[field] = cast(data[field])
+    except (KeyError, TypeError, ValueError):
+        return None
+    data['date_str'] = local_datetime(data['ts_ms'], data['tz_offset_min']).strftime("%Y-%m-%d")
+    data['schema_version'] = SCHEMA_VERSION
+    return data
+
+def save_logs_batch(entries, attachments=None):
+    """
+    Writes log entries queued in the browser outbox (see outbox.py) in batched commits.
+    The client-generated 'id' becomes the document id and ids already stored are
+    skipped, so a batch replayed after a reconnect never duplicates an entry.
+    `attachments` maps ids to fields computed on the server (e.g. a sensor summary,
+    see sensor_ingest.py), added after validation: only log fields come from the browser.
+    Returns the ids the browser may drop: stored in Firestore, or malformed.
+    Entries Firestore did not take are shown from the local session meanwhile,
+    but stay queued on the device until a later flush stores them.
+    """
+    logs, dropped = {}, []
+    for entry in entries:
+        doc_id = str(entry.get('id', ''))
+        data = _outbox_entry(entry) if _OUTBOX_ID.match(doc_id) else None
+        if data is None:
+            dropped.append(doc_id)
+        else:
+            logs[doc_id] = {**data, **(attachments or {}).get(doc_id, {})}
+
+    synced = st.session_state.setdefault('outbox_synced', set())
+    fresh = {doc_id: _stage_write(data) for doc_id, data in logs.items() if doc_id not in synced}
+
+    if fresh and is_online():
         try:
-            query = db.collection(COLLECTION_NAME).order_by('timestamp', direction=firestore.Query.DESCENDING)
-            if limit:
-                query = query.limit(limit)
-                
-            # Use get() for blocking retrieval (safer against stream hangs)
-            # This fetches all logic snapshots at once
-            docs = query.get(timeout=5)
-            for doc in docs:
-                log_data = doc.to_dict()
-                if 'completed_at' in log_data and log_data['completed_at']:
-                    log_data['datetime'] = log_data['completed_at']
-                elif 'timestamp' in log_data and log_data['timestamp']:
-                    log_data['datetime'] = log_data['timestamp']
-                logs.append(log_data)
+            collection = db.collection(COLLECTION_NAME)
+            ids = list(fresh)
+            for i in range(0, len(ids), MAX_BATCH_WRITES):
+                refs = [collection.document(doc_id) for doc_id in ids[i:i + MAX_BATCH_WRITES]]
+                # Projected existence check: a replayed entry costs a read, never a second document
+                stored = {snap.id for snap in db.get_all(refs, field_paths=['schema_version']) if snap.exists}
+                batch = db.batch()
+                for ref in refs:
+                    if ref.id not in stored:
+                        batch.set(ref, {**fresh[ref.id], 'timestamp': firestore.SERVER_TIMESTAMP})
+                batch.commit()
+                synced.update(ref.id for ref in refs)
+                _written(*(fresh[ref.id]['date_str'] for ref in refs if ref.id not in stored))
         except Exception as e:
-            # Show error to user to diagnose
-            st.error(f"DB Error (Switching to Offline): {e}")
-            # Auto-switch to offline to prevent further hangs
-            st.session_state['force_offline'] = True
-            pass
-            
-    # 2. Fetch from Local Session
-    local_logs = st.session_state.get('offline_logs', [])
-    logs.extend(local_logs)
-    
+            report_db_error(e)
+
+    # Local copies: added while Firestore is unavailable, dropped once the entry is stored
+    offline_logs = [log for log in st.session_state['offline_logs'] if log.get('id') not in synced]
+    local_ids = {log.get('id') for log in offline_logs}
+    for doc_id, data in fresh.items():
+        if doc_id not in synced and doc_id not in local_ids:
+            offline_logs.append({**data, 'id': doc_id, 'timestamp': datetime.datetime.now()})
+    st.session_state['offline_logs'] = offline_logs
+
+    return [doc_id for doc_id in logs if doc_id in synced] + dropped
+
+def mark_history_changed(day):
+    """Records a committed change to the closed day `day`."""
+    global _history_revision
+    with _history_lock:
+        _history_revision += 1
+        _history_changes.append((_history_revision, day))
+
+def history_revision():
+    """
+    Revision of the closed days as written by this process. Other server processes
+    don't see it: without the snapshot, their backdated writes reach this process's
+    caches only after a restart.
+    """
+    return _history_revision
+
+def history_changed_days(since_revision):
+    """Days changed after revision `since_revision`, or None once they have left the change log."""
+    with _history_lock:
+        changes = list(_history_changes)
+        if _history_revision > since_revision and (not changes or changes[0][0] > since_revision + 1):
+            return None
+        return [day for revision, day in changes if revision > since_revision]
+
+def is_online():
+    """True when Firestore is configured and the user has not forced offline mode."""
+    return db is not None and not st.session_state.get('force_offline', False)
+
+def report_db_error(e):
+    # Show error to user to diagnose
+    st.error(f"DB Error (Switching to Offline): {e}")
+    # Auto-switch to offline to prevent further hangs
+    st.session_state['force_offline'] = True
+
+def _normalize(log_data):
+    # Migrated documents are already canonical; this only guards stragglers
+    return log_data if is_canonical(log_data) else to_canonical(log_data)
+
+def type_query(log_type, start_date=None, end_date=None, fields=None):
+    """
+    Newest-first query for a single log type, optionally bounded by event time
+    and projected to `fields`.
+    Requires a composite index on (type ASC, ts_ms DESC).
+    """
+    query = db.collection(COLLECTION_NAME).where(filter=FieldFilter('type', '==', log_type))
+    if start_date:
+        query = query.where(filter=FieldFilter('ts_ms', '>=', to_epoch_ms(start_date)))
+    if end_date:
+        query = query.where(filter=FieldFilter('ts_ms', '<=', to_epoch_ms(end_date)))
+    if fields:
+        # schema_version marks projected rows as canonical
+        query = query.select(['schema_version', *fields])
+    return query.order_by('ts_ms', direction=firestore.Query.DESCENDING)
+
+def archive_query(start_date=None):
+    """Monthly archives (see archive.py) overlapping the range; a handful of documents per year."""
+    query = db.collection(ARCHIVE_COLLECTION)
+    if start_date:
+        query = query.where(filter=FieldFilter('month', '>=', start_date.strftime("%Y-%m")))
+    return query
+
+def log_queries(start_date=None, end_date=None, types=LOG_TYPES, fields=None):
+    """
+    One query per type, plus 'archive' for entries already compacted into monthly totals.
+    `fields` optionally maps a type to its projection.
+    """
+    fields = fields or {}
+    queries = {log_type: type_query(log_type, start_date, end_date, fields.get(log_type)) for log_type in types}
+    queries['archive'] = archive_query(start_date)
+    return queries
+
+def latest_weight_query(start_date=None):
+    return type_query('weight', start_date, fields=['weight']).limit(1)
+
+def kpi_queries(start_date=None, activity=None):
+    """
+    Server-side aggregations for the KPI tiles: only sums and a single
+    weight cross the wire. Activity filtering needs an index on (type, activity, ts_ms).
+    """
+    exercise = type_query('exercise', start_date)
+    if activity:
+        exercise = exercise.where(filter=FieldFilter('activity', '==', activity))
+    return {
+        'kpi_exercise': exercise.sum('duration_minutes', alias='exercise_minutes').sum('calories', alias='calories'),
+        'kpi_meditation': type_query('meditation', start_date).sum('duration_minutes', alias='meditation_minutes'),
+        'kpi_weight': latest_weight_query(start_date),
+    }
+
+def _run_query(query):
+    # Use get() for blocking retrieval (safer against stream hangs)
+    if isinstance(query, AggregationQuery):
+        # A single result set holding one value per alias
+        return {result.alias: result.value for result in db.get(query, timeout=5)[0]}
+    return [_normalize(doc.to_dict()) for doc in db.get(query, timeout=5)]
+
+def fetch_remote(queries):
+    """
+    Runs a dict of named Firestore queries concurrently and returns the rows per name.
+    Wall-clock time is that of the slowest query, not the sum.
+    Touches no session state, so it is safe to call from a worker thread.
+    Raises on failure; callers decide how to surface the error.
+    """
+    # Each task runs in a copy of the caller's context, so its reads are billed to the caller's run
+    futures = {
+        name: _query_pool.submit(contextvars.copy_context().run, _run_query, query)
+        for name, query in queries.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+def fetch_remote_logs(start_date=None, end_date=None, types=LOG_TYPES):
+    """Firestore-only logs, one concurrent query per type, archived days included."""
+    if db is None:
+        return []
+    results = fetch_remote(log_queries(start_date, end_date, types))
+    logs = archived_logs(results, start_date, end_date, types)
+    for log_type in types:
+        logs.extend(results[log_type])
     return logs
 
+def archived_logs(remote, start_date=None, end_date=None, types=LOG_TYPES):
+    """Daily-total rows expanded from the 'archive' result of log_queries."""
+    return filter_logs(expand_all(remote.get('archive', [])), start_date, end_date, types)
+
+def filter_logs(logs, start_date=None, end_date=None, types=LOG_TYPES):
+    """Applies the same type and date bounds as the Firestore queries to in-memory logs."""
+    start_ms = to_epoch_ms(start_date) if start_date else None
+    end_ms = to_epoch_ms(end_date) if end_date else None
+    filtered = []
+    for log in logs:
+        if log.get('type') not in types:
+            continue
+        if start_ms is not None and log['ts_ms'] < start_ms:
+            continue
+        if end_ms is not None and log['ts_ms'] > end_ms:
+            continue
+        filtered.append(log)
+    return filtered
+
+def newest_first(logs, log_type):
+    return sorted((log for log in logs if log['type'] == log_type), key=lambda log: log['ts_ms'], reverse=True)
+
+def latest_weight(remote_rows, local_logs):
+    """
+    Picks the most recent weight value, or None if there is none.
+    Local entries were written during this session, so they win over remote ones.
+    """
+    local = filter_logs(local_logs, types=('weight',))
+    if local:
+        return local[-1]['weight']
+    if remote_rows:
+        return remote_rows[0]['weight']
+    return None
+
+def kpi_totals(remote, local_logs, start_date=None, activity=None):
+    """
+    Combines the results of kpi_queries with archived days (the 'archive' result
+    of log_queries) and the entries still held locally.
+    Returns {'weight', 'calories', 'exercise_minutes', 'meditation_minutes'}.
+    """
+    archived = archived_logs(remote, start_date)
+    weight_rows = remote['kpi_weight'] or newest_first(archived, 'weight')
+    totals = {
+        'weight': latest_weight(weight_rows, filter_logs(local_logs, start_date, types=('weight',))) or 0,
+        'calories': remote['kpi_exercise'].get('calories') or 0,
+        'exercise_minutes': remote['kpi_exercise'].get('exercise_minutes') or 0,
+        'meditation_minutes': remote['kpi_meditation'].get('meditation_minutes') or 0,
+    }
+    extra = archived + filter_logs(local_logs, start_date)
+    for log in extra:
+        if log['type'] == 'weight':
+            continue
+        if log['type'] == 'meditation':
+            totals['meditation_minutes'] += log.get('duration_minutes', 0)
+        elif not activity or log.get('activity') == activity:
+            totals['exercise_minutes'] += log.get('duration_minutes', 0)
+            totals['calories'] += log.get('calories', 0)
+    return totals
+
+def get_latest_weight():
+    """Latest weight via a single limit(1) query, or None if never logged."""
+    remote_rows = []
+    if is_online() and not metering.over_budget():
+        try:
+            remote_rows = fetch_remote({'weight': latest_weight_query()})['weight']
+        except Exception as e:
+            report_db_error(e)
+    return latest_weight(remote_rows, st.session_state.get('offline_logs', []))
+
+# --- History (edit / delete) ---
+
+def history_query(log_type=None, activity=None):
+    """
+    Newest-first raw entries, optionally of one type and exercise activity.
+    Uses the (type, ts_ms DESC) and (type, activity, ts_ms) indexes of the type queries.
+    """
+    query = db.collection(COLLECTION_NAME)
+    if log_type:
+        query = query.where(filter=FieldFilter('type', '==', log_type))
+    if activity:
+        query = query.where(filter=FieldFilter('activity', '==', activity))
+    return query.order_by('ts_ms', direction=firestore.Query.DESCENDING)
+
+def history_page(log_type=None, activity=None, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    One page of raw entries as ([{'id', **log}], next_cursor). The cursor is the last
+    document of the previous page (None for the first); one extra document is read
+    to know whether a next page exists, so next_cursor is None on the last page.
+    Reads at most page_size + 1 documents however long the history is.
+    """
+    query = history_query(log_type, activity)
+    if cursor is not None:
+        query = query.start_after(cursor)
+    docs = db.get(query.limit(page_size + 1), timeout=5)
+    rows = [{'id': doc.id, **_normalize(doc.to_dict())} for doc in docs[:page_size]]
+    return rows, (docs[page_size - 1] if len(docs) > page_size else None)
+
+def _history_edited(*date_strs):
+    # Cached dashboard loads may still hold the old version of the entry
+    st.session_state.pop('dashboard_prefetch', None)
+    st.session_state.pop('dashboard_cache', None)
+    _written(*date_strs)
+
+def update_log(doc_id, old, data):
+    """
+    Replaces entry `doc_id` (currently `old`) with `data`, canonicalized, e.g. with
+    a new 'completed_at'. Fields of `old` that `data` does not set are kept.
+    The fresh write time lets snapshot refreshes pick it up.
+    """
+    kept = {
+        field: value for field, value in old.items()
+        if field not in ('id', 'timestamp', 'schema_version', 'ts_ms', 'tz_offset_min', 'date_str')
+    }
+    data = to_canonical({**kept, **data})
+    batch = db.batch()
+    batch.set(db.collection(COLLECTION_NAME).document(doc_id), {**data, 'timestamp': firestore.SERVER_TIMESTAMP})
+    batch.commit()
+    _history_edited(old['date_str'], data['date_str'])
+
+def delete_log(doc_id, old):
+    """Deletes entry `doc_id` (currently `old`) and records its tombstone in the same batch."""
+    batch = db.batch()
+    batch.delete(db.collection(COLLECTION_NAME).document(doc_id))
+    batch.set(db.collection(DELETED_COLLECTION).document(doc_id), {
+        'type': old['type'],
+        'ts_ms': old['ts_ms'],
+        'tz_offset_min': old['tz_offset_min'],
+        # Commit time, like entries' 'timestamp': snapshot refreshes page on it (see snapshot.py)
+        'deleted_at': firestore.SERVER_TIMESTAMP,
+    })
+    batch.commit()
+    _history_edited(old['date_str'])
+
 def save_meditation_session(duration_minutes, custom_date=None):
     log_data = {
         "type": "meditation",
         "duration_minutes": duration_minutes,
         "completed_at": custom_date if custom_date else datetime.datetime.now()
     }
-    
-    if custom_date:
-        log_data['date_str'] = custom_date.strftime("%Y-%m-%d")
         
     return save_log(log_data)
 
@@ -139,8 +467,5 @@ def save_exercise_session(activity_type, duration_minutes, calories, custom_date
         "calories": calories,
         "completed_at": custom_date if custom_date else datetime.datetime.now()
     }
-    
-    if custom_date:
-        log_data['date_str'] = custom_date.strftime("%Y-%m-%d")
         
     return save_log(log_data)